@@ -7,9 +7,10 @@ It sets up:
 
 
 import google.generativeai as gen_ai
-from groq import Groq
+from groq import AsyncGroq
 from google import genai
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
 
 load_dotenv()
@@ -24,8 +25,120 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 gen_ai.configure(api_key=GEMINI_API_KEY)
 
-GEMINI_AI = gen_ai.GenerativeModel("gemini-2.0-flash")
+GEMINI_TEXT_MODEL = os.getenv("LLM_TIER_CHAT_MODEL", "gemini-2.0-flash")
+
+GEMINI_AI = gen_ai.GenerativeModel(GEMINI_TEXT_MODEL)
 
 GEMINI_IMAGE_AI = genai.Client(api_key=GEMINI_API_KEY)
 
-GROQ = Groq(api_key=GROQ_API_KEY)
\ No newline at end of file
+GROQ = AsyncGroq(api_key=GROQ_API_KEY)
+
+
+# LLM GATEWAY LIMITS (applied separately to every upstream model)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_DEFAULT_TIMEOUT = float(os.getenv("LLM_DEFAULT_TIMEOUT", "25"))
+# Send the static part of split templates as the model's system instruction
+# (false: prepend it to every request instead).
+LLM_SYSTEM_INSTRUCTION = os.getenv("LLM_SYSTEM_INSTRUCTION", "true").lower() == "true"
+
+
+# LLM RESPONSE CACHE
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "2000"))
+RESPONSE_CACHE_DB_ROWS = int(os.getenv("RESPONSE_CACHE_DB_ROWS", "50000"))
+
+
+# IMAGE ANALYSIS CACHE
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_MEMORY_SIZE = int(os.getenv("IMAGE_CACHE_MEMORY_SIZE", "1000"))
+IMAGE_CACHE_DB_ROWS = int(os.getenv("IMAGE_CACHE_DB_ROWS", "20000"))
+# Also match re-encoded or resized copies by perceptual hash (dHash). Off by
+# default: dHash sees a 9x8 grayscale thumbnail, so screenshots or memes that
+# differ only in their text hash (almost) the same.
+IMAGE_CACHE_NEAR_DUPLICATES = (
+    os.getenv("IMAGE_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+)
+# Largest Hamming distance between two 64-bit dHashes treated as the same image.
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "1"))
+
+
+# MODEL ROUTING
+# Every call site names a route (usually its prompt template); MODEL_ROUTES maps
+# routes to tiers and MODEL_TIERS gives each tier its model, timeout and limits.
+# Each tier setting can be overridden with LLM_TIER_<TIER>_<SETTING>, routes
+# with LLM_ROUTES="route=tier,route=tier".
+
+
+def _tier(name, model, timeout, concurrency, rate_per_second):
+    prefix = f"LLM_TIER_{name.upper()}_"
+    return {
+        "model": os.getenv(prefix + "MODEL", model),
+        "timeout": float(os.getenv(prefix + "TIMEOUT", timeout)),
+        "concurrency": int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        "rate_per_second": float(os.getenv(prefix + "RATE_PER_SECOND", rate_per_second)),
+    }
+
+
+MODEL_TIERS = {
+    # User-facing answers.
+    "chat": _tier("chat", GEMINI_TEXT_MODEL, 25, LLM_MAX_CONCURRENCY, LLM_RATE_PER_SECOND),
+    # Classification, rewriting and housekeeping calls.
+    "fast": _tier("fast", "gemini-2.0-flash-lite", 10, 16, 10),
+}
+
+DEFAULT_TIER = "chat"
+
+MODEL_ROUTES = {
+    "short_response": "fast",
+    "optimize_query": "fast",
+    "detect_voice": "fast",
+    "image_request": "fast",
+    "image_success": "fast",
+    "image_failure": "fast",
+    "render_image_prompt": "fast",
+    "photolab": "fast",
+    "memory_prompt": "fast",
+    "memory_update": "fast",
+    "useless_message": "fast",
+}
+
+for _route in filter(None, os.getenv("LLM_ROUTES", "").split(",")):
+    _name, _, _tier_name = _route.partition("=")
+    if _tier_name.strip() in MODEL_TIERS:
+        MODEL_ROUTES[_name.strip()] = _tier_name.strip()
+
+GEMINI_MODELS = {
+    name: GEMINI_AI
+    if tier["model"] == GEMINI_TEXT_MODEL
+    else gen_ai.GenerativeModel(tier["model"])
+    for name, tier in MODEL_TIERS.items()
+}
+
+
+@lru_cache(maxsize=32)
+def gemini_model(tier, system_instruction=""):
+    """
+    Returns the GenerativeModel of a tier, bound to a fixed system instruction.
+
+    Args:
+        tier (str): Name of the tier in MODEL_TIERS.
+        system_instruction (str): Static instruction; the shared model when empty.
+
+    Returns:
+        GenerativeModel: Cached per (tier, instruction) pair.
+    """
+    if not system_instruction:
+        return GEMINI_MODELS[tier]
+    return gen_ai.GenerativeModel(
+        MODEL_TIERS[tier]["model"], system_instruction=system_instruction
+    )
@@ -0,0 +1,272 @@
+"""
+Background history curation.
+
+Replaces the inline clean-up that used to run on every 10th reply: a periodic
+job picks users with enough un-curated messages and deletes the rows that are
+noise with set-based SQL. No user message waits on this work.
+
+Most messages are decided locally by `classify_message` (greetings, fillers,
+emoji-only and repeated messages are dropped, even when phrased as a
+question; questions with content and substantive messages are kept; short
+follow-ups and yes/no answers are left to the model). Only
+the ambiguous rest of several users is sent to Gemini in one
+structured-output (JSON) call.
+"""
+
+import asyncio
+import json
+import os
+import re
+
+from dotenv import load_dotenv
+
+from AI.gateway import gateway
+from database.db import DatabaseManager
+from logger_config import logger
+from prompt import format_prompt
+
+load_dotenv()
+
+# A user is curated once this many messages have been saved since the last run.
+CURATION_MIN_NEW_MESSAGES = int(os.getenv("CURATION_MIN_NEW_MESSAGES", "10"))
+CURATION_INTERVAL_SECONDS = int(os.getenv("CURATION_INTERVAL_SECONDS", "300"))
+# Users per model call, and messages per user in one call.
+CURATION_USERS_PER_CALL = int(os.getenv("CURATION_USERS_PER_CALL", "5"))
+CURATION_MESSAGES_PER_USER = int(os.getenv("CURATION_MESSAGES_PER_USER", "30"))
+CURATION_USERS_PER_RUN = int(os.getenv("CURATION_USERS_PER_RUN", "50"))
+
+JSON_OUTPUT = {"response_mime_type": "application/json"}
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+NOISE = "noise"
+KEEP = "keep"
+
+# Greetings, formalities and reactions (English, Uzbek, Russian), without
+# apostrophes. A message made of at least FILLER_RATIO of these words carries
+# no information.
+FILLER_WORDS = {
+    "ok", "okay", "k", "kk", "yes", "yeah", "yep", "no", "nope", "hmm", "hm",
+    "lol", "haha", "hahaha", "xd", "good", "nice", "cool", "great", "fine",
+    "thanks", "thank", "thx", "ty", "you", "u", "hi", "hello", "hey", "yo",
+    "bye", "morning", "evening", "night", "how", "are", "i", "am", "im", "m",
+    "understood", "sure", "alright", "wow", "oh", "ah", "well", "very", "much",
+    "doing", "today", "whats", "hows", "up", "sup", "going", "there", "guys",
+    "everyone",
+    "salom", "rahmat", "ha", "yoq", "xop", "zor", "yaxshi", "assalomu",
+    "alaykum", "qalesiz", "qalaysan", "privet", "привет", "спасибо", "ок",
+    "да", "нет", "хорошо", "пока", "ага", "угу",
+}
+FILLER_RATIO = 0.8
+# Filler messages made only of these words are greetings and small talk, noise
+# even when phrased as a question.
+GREETING_WORDS = {
+    "hi", "hello", "hey", "yo", "how", "are", "you", "u", "doing", "today",
+    "whats", "hows", "up", "sup", "going", "there", "guys", "everyone",
+    "morning", "evening", "night", "good", "i", "am", "im", "m", "fine",
+    "thanks", "thank", "salom", "assalomu", "alaykum", "qalesiz", "qalaysan",
+    "privet", "привет",
+}
+# Other short questions and yes/no answers ("How much?", "Are you sure?", "no")
+# only make sense next to the bot's reply, so the model decides them.
+ANSWER_WORDS = {"yes", "yeah", "yep", "no", "nope", "sure", "ha", "yoq", "да", "нет"}
+# Signals that a message is worth keeping without asking the model.
+PERSONAL = re.compile(
+    r"\b(my|i'm a|i am a|i work|i live|i study|i want|i need|i plan|i like|i love)\b",
+    re.IGNORECASE,
+)
+SUBSTANCE = re.compile(r"\d|https?://|`|[=+*/<>{}\[\]]")
+SUBSTANTIVE_WORDS = 8
+
+
+def classify_message(text: str, seen: set):
+    """
+    Decides locally whether a message is noise, worth keeping, or unclear.
+
+    Args:
+        text (str): The user's message.
+        seen (set): Normalised earlier messages of the same user; updated in place.
+
+    Returns:
+        str | None: NOISE, KEEP, or None when the model should decide.
+    """
+    normalised = " ".join(re.findall(r"[\w']+", text.lower()))
+    if not normalised:
+        return NOISE  # emoji, punctuation or whitespace only
+
+    words = normalised.split()
+    bare = {word.replace("'", "") for word in words}
+    fillers = sum(1 for word in words if word.replace("'", "") in FILLER_WORDS)
+    small_talk = fillers / len(words) >= FILLER_RATIO
+    if small_talk and not bare <= GREETING_WORDS:
+        if "?" in text or bare & ANSWER_WORDS:
+            return None  # a follow-up or an answer, which needs its context
+
+    if normalised in seen:
+        return NOISE  # repeats an earlier message
+    seen.add(normalised)
+    if small_talk:
+        return NOISE  # greetings and reactions
+    if SUBSTANCE.search(text) or PERSONAL.search(text):
+        return KEEP
+    # Not small talk, so a question mark marks a question with content.
+    if "?" in text:
+        return KEEP
+    if len(words) >= SUBSTANTIVE_WORDS:
+        return KEEP
+    return None
+
+
+def parse_delete_ids(text: str, allowed: set) -> list:
+    """
+    Extracts the IDs to delete from the model's JSON answer.
+
+    Args:
+        text (str): Model output, `{"delete": [...]}`, optionally in a code fence.
+        allowed (set): IDs that were sent; anything else is ignored.
+
+    Returns:
+        list: History IDs to delete.
+    """
+    data = json.loads(CODE_FENCE.sub("", text.strip()))
+    ids = data.get("delete", []) if isinstance(data, dict) else []
+    result = []
+    for value in ids:
+        try:
+            history_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if history_id in allowed:
+            result.append(history_id)
+    return result
+
+
+class HistoryCurator:
+    """Periodic job that removes low-value messages from users' history."""
+
+    def __init__(
+        self,
+        min_new_messages: int = CURATION_MIN_NEW_MESSAGES,
+        interval: int = CURATION_INTERVAL_SECONDS,
+    ):
+        """
+        Args:
+            min_new_messages (int): Un-curated messages needed before a user is curated.
+            interval (int): Seconds between two runs of `run_forever`.
+        """
+        self.db = DatabaseManager()
+        self.min_new_messages = min_new_messages
+        self.interval = interval
+        self.stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats() -> dict:
+        """Counters of one run: decisions made locally vs. by the model."""
+        return {
+            "messages": 0,
+            "local_noise": 0,
+            "local_keep": 0,
+            "sent_to_model": 0,
+            "model_deleted": 0,
+            "model_calls": 0,
+        }
+
+    async def curate_users(self, user_ids: list) -> int:
+        """
+        Curates the pending messages of a group of users, using at most one
+        model call for the messages the local classifier cannot decide.
+
+        Args:
+            user_ids (list): Users to curate together.
+
+        Returns:
+            int: Number of deleted history rows.
+        """
+        conversations = []
+        newest = {}
+        delete_ids = []
+        for user_id in user_ids:
+            rows = await self.db.get_uncurated_messages(
+                user_id, CURATION_MESSAGES_PER_USER
+            )
+            if not rows:
+                continue
+            newest[user_id] = rows[-1][0]
+            seen = set()
+            messages = []
+            for history_id, text in rows:
+                if not text or not text.strip():
+                    continue  # bot-initiated turns (e.g. /getfacts) have no message
+                self.stats["messages"] += 1
+                verdict = classify_message(text, seen)
+                if verdict == NOISE:
+                    self.stats["local_noise"] += 1
+                    delete_ids.append(history_id)
+                elif verdict == KEEP:
+                    self.stats["local_keep"] += 1
+                else:
+                    messages.append({"id": history_id, "text": text})
+            if messages:
+                conversations.append({"user": str(user_id), "messages": messages})
+
+        if conversations:
+            prompt = format_prompt(
+                "useless_message",
+                text_user=json.dumps(conversations, ensure_ascii=False),
+            )
+            response = await gateway.generate(
+                prompt, route="useless_message", generation_config=JSON_OUTPUT
+            )
+            allowed = {m["id"] for c in conversations for m in c["messages"]}
+            model_ids = parse_delete_ids(response.text, allowed)
+            self.stats["model_calls"] += 1
+            self.stats["sent_to_model"] += len(allowed)
+            self.stats["model_deleted"] += len(model_ids)
+            delete_ids.extend(model_ids)
+
+        await self.db.delete_by_id(delete_ids)
+        for user_id, last_id in newest.items():
+            await self.db.mark_curated(user_id, last_id)
+        return len(delete_ids)
+
+    async def run_once(self) -> int:
+        """
+        Curates every user that crossed the threshold, a few users per call.
+
+        Returns:
+            int: Total number of deleted history rows.
+        """
+        self.stats = self._new_stats()
+        user_ids = await self.db.get_curation_candidates(
+            self.min_new_messages, CURATION_USERS_PER_RUN
+        )
+        deleted = 0
+        for start in range(0, len(user_ids), CURATION_USERS_PER_CALL):
+            group = user_ids[start : start + CURATION_USERS_PER_CALL]
+            try:
+                deleted += await self.curate_users(group)
+            except Exception as e:
+                logger.error(f"History curation failed for {group}: {e}")
+
+        stats = self.stats
+        if stats["messages"]:
+            local = stats["local_noise"] + stats["local_keep"]
+            logger.info(
+                f"🧹 Curation: {stats['messages']} messages, {local} decided locally "
+                f"({stats['local_noise']} noise, {stats['local_keep']} kept), "
+                f"{stats['sent_to_model']} sent to the model in "
+                f"{stats['model_calls']} call(s), {stats['model_deleted']} deleted by it."
+            )
+        return deleted
+
+    async def run_forever(self) -> None:
+        """
+        Background task that runs `run_once` every `interval` seconds.
+        """
+        while True:
+            try:
+                deleted = await self.run_once()
+                if deleted:
+                    logger.info(f"🧹 Curation removed {deleted} history rows.")
+            except Exception as e:
+                logger.error(f"History curation failed: {e}")
+            await asyncio.sleep(self.interval)
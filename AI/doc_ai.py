@@ -1,4 +1,5 @@
-from AI.ai_config import GEMINI_AI
+from AI.gateway import gateway
+from AI.post_processor import post_processor
 from database.db import DatabaseManager
 from AI.text_ai import TextAIHandler
 from prompt import format_prompt
@@ -7,10 +8,34 @@ import os
 import docx
 import pandas as pd
 from logger_config import logger
-from utils import async_wrap_blocking
+from utils import run_blocking
 import asyncio
 import aiofiles
 
+
+def extract_text(file_path: str) -> str:
+    """
+    Parses a PDF, DOCX, CSV or XLSX file and returns its text.
+
+    Args:
+        file_path (str): Path to the document.
+
+    Returns:
+        str: Extracted text content, or None for other formats.
+    """
+    if file_path.endswith(".pdf"):
+        with fitz.open(file_path) as doc:
+            return "\n".join([page.get_text() for page in doc])
+    if file_path.endswith(".docx"):
+        doc = docx.Document(file_path)
+        return "\n".join([para.text for para in doc.paragraphs])
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path).to_string(index=False)
+    if file_path.endswith(".xlsx"):
+        return pd.read_excel(file_path).to_string(index=False)
+    return None
+
+
 class DocAIHandler:
     """Handles document reading, analysis, and summarization via Gemini AI."""
 
@@ -32,21 +57,9 @@ class DocAIHandler:
         Raises:
             ValueError: If the file format is unsupported.
         """
-        if file_path.endswith(".pdf"):
-            doc = await async_wrap_blocking(fitz.open, file_path)
-            return "\n".join([page.get_text() for page in doc])
-
-        elif file_path.endswith(".docx"):
-            doc = await async_wrap_blocking(docx.Document, file_path)
-            return "\n".join([para.text for para in doc.paragraphs])
-
-        elif file_path.endswith(".csv"):
-            df = await async_wrap_blocking(pd.read_csv, file_path)
-            return df.to_string(index=False)
-
-        elif file_path.endswith(".xlsx"):
-            df = await async_wrap_blocking(pd.read_excel, file_path)
-            return df.to_string(index=False)
+        if file_path.endswith((".pdf", ".docx", ".csv", ".xlsx")):
+            # Parsing is CPU-bound; keep it off the event loop and the I/O pool.
+            return await run_blocking("cpu", extract_text, file_path)
 
         else:
             try:
@@ -74,23 +87,19 @@ class DocAIHandler:
             try:
                 file_text = await self.read_file_async(file_path)
             except ValueError:
-                os.remove(file_path)
+                await run_blocking("io", os.remove, file_path)
                 return "❌ Unsupported file format."
 
             prompt_ = format_prompt("docs_prompt", prompt=prompt)
             ai_input = f"{prompt_}\n\n{file_text[:100000]}"
 
             try:
-                response = await asyncio.wait_for(
-                    async_wrap_blocking(GEMINI_AI.generate_content, contents=ai_input),
-                    timeout=10,
-                )
+                response = await gateway.generate(ai_input, route="docs_prompt", timeout=10)
             except asyncio.TimeoutError:
                 logger.error("⏰ Document analysis timed out.")
                 return "⏰ Document analysis timed out."
 
-            short_response = await self.textai_handler.get_ai_short_response(response)
-            await self.db.save_history(user_id, prompt, short_response)
+            await post_processor.submit(user_id, prompt, response.text)
 
             return response.text.strip()
 
@@ -0,0 +1,515 @@
+"""
+Central gateway for upstream LLM calls (Gemini and Groq).
+
+Every model call goes through `gateway`, which applies, per model or tier:
+- a bounded semaphore limiting concurrent in-flight calls,
+- a token-bucket rate limiter,
+- jittered exponential backoff on 429 / 5xx / connection errors,
+- a circuit breaker that fails fast while the upstream keeps failing.
+
+Identical text prompts sent to the same model while one is already in flight
+are coalesced (single-flight): they await the same upstream call and share
+its response.
+
+Gemini text calls name a route (usually the prompt template). The route is
+mapped to a model tier (see MODEL_ROUTES / MODEL_TIERS in ai_config), which
+selects the model, the default timeout and the limits the call runs under.
+
+Calls use the SDKs' native async APIs, so a slow upstream holds a coroutine,
+not a worker thread.
+
+The static part of a prompt can be passed separately as `system_instruction`.
+It is then bound to the model instead of being re-sent inside every request.
+Per-tier token counters (estimated by section, and as reported by the API)
+show how much of the input is static.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional
+
+from AI.ai_config import (
+    DEFAULT_TIER,
+    GEMINI_MODELS,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_BREAKER_COOLDOWN,
+    LLM_BREAKER_THRESHOLD,
+    LLM_DEFAULT_TIMEOUT,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_RATE_BURST,
+    LLM_RATE_PER_SECOND,
+    LLM_SYSTEM_INSTRUCTION,
+    MODEL_ROUTES,
+    MODEL_TIERS,
+    gemini_model,
+)
+from logger_config import logger
+from prompt import estimate_tokens
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Decides whether a failed upstream call is worth retrying.
+
+    Args:
+        error (Exception): The exception raised by the SDK.
+
+    Returns:
+        bool: True for rate limits, server errors and connection problems.
+    """
+    if isinstance(error, ConnectionError):
+        return True
+    for attr in ("code", "status_code"):
+        code = getattr(error, attr, None)
+        if callable(code):
+            try:
+                code = code()
+            except Exception:
+                code = None
+        if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+            return True
+    name = type(error).__name__
+    return name in {
+        "ResourceExhausted",
+        "ServiceUnavailable",
+        "InternalServerError",
+        "TooManyRequests",
+        "RateLimitError",
+        "APIConnectionError",
+        "DeadlineExceeded",
+    }
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` tokens per second, up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a token is available and takes it."""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `cooldown` seconds; then lets a single probe call through (half-open)
+    and closes again if it succeeds.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        """Returns "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def before_call(self, name: str) -> bool:
+        """
+        Raises CircuitOpenError if the call must not be attempted.
+
+        Returns:
+            bool: True if the call is the half-open probe; the caller must then
+                `release_probe()` once it is done, whatever the outcome.
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self.probing):
+            raise CircuitOpenError(f"Circuit for {name} is open, failing fast.")
+        if state == "half-open":
+            self.probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Lets the next call probe again if the probe ended without an outcome
+        (e.g. it was cancelled)."""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class _ModelLimits:
+    """Concurrency, rate, breaker state and metrics of one model or tier."""
+
+    def __init__(
+        self,
+        concurrency: int = LLM_MAX_CONCURRENCY,
+        rate_per_second: float = LLM_RATE_PER_SECOND,
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate_per_second, LLM_RATE_BURST)
+        self.breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        # "system"/"content": estimated input tokens per prompt section;
+        # "prompt"/"cached": input tokens as reported in usage_metadata.
+        self.tokens = {"system": 0, "content": 0, "prompt": 0, "cached": 0}
+
+    def record(self, started: float, failed: bool) -> None:
+        """Adds one upstream attempt to the metrics."""
+        self.calls += 1
+        self.failures += failed
+        self.seconds += time.monotonic() - started
+
+    def record_tokens(self, system: str, contents: Any, usage: Any = None) -> None:
+        """Adds the input tokens of one completed request to the metrics."""
+        self.tokens["system"] += estimate_tokens(system)
+        if isinstance(contents, str):
+            self.tokens["content"] += estimate_tokens(contents)
+        if usage is not None:
+            self.tokens["prompt"] += getattr(usage, "prompt_token_count", 0) or 0
+            self.tokens["cached"] += getattr(usage, "cached_content_token_count", 0) or 0
+
+
+class LLMGateway:
+    """Runs upstream model calls under per-model limits, retries and breakers."""
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._limits: dict = {}
+        self._inflight: dict = {}
+        self.coalesced = 0
+
+    def _limits_for(self, name: str) -> _ModelLimits:
+        limits = self._limits.get(name)
+        if limits is None:
+            tier = MODEL_TIERS.get(name)
+            limits = self._limits[name] = (
+                _ModelLimits(tier["concurrency"], tier["rate_per_second"])
+                if tier
+                else _ModelLimits()
+            )
+        return limits
+
+    @staticmethod
+    def tier_for(route: Optional[str]) -> str:
+        """
+        Returns the tier a route is served by.
+
+        Args:
+            route (str, optional): Call site or prompt template name.
+
+        Returns:
+            str: Key of MODEL_TIERS.
+        """
+        return MODEL_ROUTES.get(route, DEFAULT_TIER)
+
+    def metrics(self) -> dict:
+        """
+        Returns:
+            dict: Per model/tier attempt count, failures, mean latency in
+                milliseconds, circuit breaker state and input token counters.
+        """
+        return {
+            name: {
+                "calls": limits.calls,
+                "failures": limits.failures,
+                "avg_ms": round(1000 * limits.seconds / limits.calls) if limits.calls else 0,
+                "breaker": limits.breaker.state,
+                "tokens": dict(limits.tokens),
+            }
+            for name, limits in self._limits.items()
+        }
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt."""
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt))
+
+    async def call(
+        self,
+        name: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = LLM_DEFAULT_TIMEOUT,
+    ) -> Any:
+        """
+        Runs an async SDK call under the limits of the given model.
+
+        Args:
+            name (str): Model name the limits are tracked under.
+            factory (Callable): Zero-argument callable returning a new awaitable
+                per attempt (e.g. functools.partial of an async SDK method).
+            timeout (float, optional): Timeout per attempt in seconds.
+
+        Returns:
+            Any: Whatever the awaitable returns.
+
+        Raises:
+            CircuitOpenError: If the model's circuit breaker is open.
+            asyncio.TimeoutError: If an attempt times out.
+            Exception: The SDK error, once it is not retryable or retries ran out.
+        """
+        limits = self._limits_for(name)
+        attempt = 0
+        while True:
+            probe = limits.breaker.before_call(name)
+            try:
+                await limits.bucket.acquire()
+                async with limits.semaphore:
+                    started = time.monotonic()
+                    try:
+                        result = await asyncio.wait_for(factory(), timeout)
+                    except asyncio.TimeoutError:
+                        limits.record(started, failed=True)
+                        limits.breaker.record_failure()
+                        raise
+                    except Exception as e:
+                        limits.record(started, failed=True)
+                        if not is_retryable(e):
+                            # The upstream answered; only this request was bad.
+                            limits.breaker.record_success()
+                            raise
+                        limits.breaker.record_failure()
+                        retry = attempt < self.max_retries
+                        if not retry or limits.breaker.state != "closed":
+                            raise
+                        logger.warning(f"⚠️ {name} call failed ({e}), retrying...")
+                    else:
+                        limits.record(started, failed=False)
+                        limits.breaker.record_success()
+                        return result
+            finally:
+                if probe:
+                    limits.breaker.release_probe()
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def single_flight(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Runs `factory()` once for all concurrent callers using the same key.
+
+        The shared call runs as its own task, so a caller that is cancelled
+        (or times out) does not cancel it for the others.
+
+        Args:
+            key (Hashable): Identity of the request.
+            factory (Callable): Zero-argument coroutine function making the call.
+
+        Returns:
+            Any: The shared result (exceptions are shared as well).
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+
+            def done(finished: asyncio.Future) -> None:
+                self._inflight.pop(key, None)
+                # Marks the exception as retrieved even if every waiter was
+                # cancelled, so asyncio does not log it as never retrieved.
+                if not finished.cancelled():
+                    finished.exception()
+
+            task.add_done_callback(done)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _bind_system(tier: str, contents: Any, system_instruction: str) -> tuple:
+        """
+        Returns the model and contents to send: the system instruction is bound
+        to the model, or prepended to the contents when that is disabled.
+        """
+        if not system_instruction:
+            return GEMINI_MODELS[tier], contents
+        if LLM_SYSTEM_INSTRUCTION:
+            return gemini_model(tier, system_instruction), contents
+        if isinstance(contents, str):
+            return GEMINI_MODELS[tier], f"{system_instruction}\n\n{contents}"
+        return GEMINI_MODELS[tier], [system_instruction, *contents]
+
+    async def generate(
+        self,
+        contents: Any,
+        route: Optional[str] = None,
+        timeout: Optional[float] = None,
+        generation_config: Optional[dict] = None,
+        system_instruction: str = "",
+    ) -> Any:
+        """
+        Calls Gemini `generate_content` on the tier of a route. Concurrent
+        calls with the same text prompt share one upstream request.
+
+        Args:
+            contents (Any): Prompt string or content parts.
+            route (str, optional): Call site or prompt template name (see MODEL_ROUTES).
+            timeout (float, optional): Timeout per attempt in seconds; the
+                tier's timeout when omitted.
+            generation_config (dict, optional): Passed to the SDK, e.g.
+                {"response_mime_type": "application/json"} for structured output.
+            system_instruction (str, optional): Static part of the prompt
+                (see prompt.format_prompt_parts).
+
+        Returns:
+            GenerateContentResponse: The raw SDK response.
+        """
+        tier = self.tier_for(route)
+        timeout = timeout or MODEL_TIERS[tier]["timeout"]
+        limits = self._limits_for(tier)
+        model, request = self._bind_system(tier, contents, system_instruction)
+        factory = partial(
+            model.generate_content_async,
+            contents=request,
+            generation_config=generation_config,
+        )
+
+        async def run():
+            response = await self.call(tier, factory, timeout)
+            limits.record_tokens(
+                system_instruction, contents, getattr(response, "usage_metadata", None)
+            )
+            return response
+
+        if not isinstance(contents, str):
+            return await run()
+
+        identity = system_instruction + contents
+        identity += json.dumps(generation_config, sort_keys=True, default=str)
+        # The timeout is part of the key: a caller with a short timeout must not
+        # join (and inherit the failure of) a flight allowed to take longer.
+        key = (tier, timeout, hashlib.sha256(identity.encode("utf-8")).hexdigest())
+        return await self.single_flight(key, run)
+
+    async def stream(
+        self,
+        contents: Any,
+        route: Optional[str] = None,
+        timeout: Optional[float] = None,
+        system_instruction: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Streams a Gemini reply through the gateway, piece by piece.
+
+        The model's concurrency slot is held until the stream ends. Streams are
+        not retried, because part of the reply may already have been shown.
+
+        Args:
+            contents (Any): Prompt string or content parts.
+            route (str, optional): Call site or prompt template name (see MODEL_ROUTES).
+            timeout (float, optional): Longest wait for the next chunk in
+                seconds; the tier's timeout when omitted.
+            system_instruction (str, optional): Static part of the prompt
+                (see prompt.format_prompt_parts).
+
+        Yields:
+            str: Text of each streamed chunk.
+        """
+        tier = self.tier_for(route)
+        timeout = timeout or MODEL_TIERS[tier]["timeout"]
+        model, request = self._bind_system(tier, contents, system_instruction)
+        limits = self._limits_for(tier)
+        probe = limits.breaker.before_call(tier)
+        try:
+            await limits.bucket.acquire()
+            async with limits.semaphore:
+                started = time.monotonic()
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents=request, stream=True),
+                        timeout,
+                    )
+                    chunks = response.__aiter__()
+                    usage = None
+                    while True:
+                        try:
+                            item = await asyncio.wait_for(chunks.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            break
+                        usage = getattr(item, "usage_metadata", None) or usage
+                        try:
+                            text = item.text
+                        except ValueError:
+                            # Chunks without text parts (e.g. only safety metadata).
+                            continue
+                        if text:
+                            yield text
+                except Exception as e:
+                    limits.record(started, failed=True)
+                    if isinstance(e, asyncio.TimeoutError) or is_retryable(e):
+                        limits.breaker.record_failure()
+                    else:
+                        # The upstream answered; only this request was bad.
+                        limits.breaker.record_success()
+                    raise
+                else:
+                    limits.record(started, failed=False)
+                    limits.record_tokens(system_instruction, contents, usage)
+                    limits.breaker.record_success()
+        finally:
+            # Also reached on cancellation or when the consumer stops early.
+            if probe:
+                limits.breaker.release_probe()
+
+    async def generate_text(
+        self,
+        contents: Any,
+        route: Optional[str] = None,
+        timeout: Optional[float] = None,
+        generation_config: Optional[dict] = None,
+        system_instruction: str = "",
+    ) -> str:
+        """
+        Same as `generate`, returning the stripped response text.
+        """
+        response = await self.generate(
+            contents,
+            route=route,
+            timeout=timeout,
+            generation_config=generation_config,
+            system_instruction=system_instruction,
+        )
+        return response.text.strip()
+
+
+gateway = LLMGateway()
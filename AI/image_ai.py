@@ -1,22 +1,87 @@
 from database.db import DatabaseManager
 from prompt import format_prompt
-from AI.ai_config import GEMINI_AI, GEMINI_IMAGE_AI
+from AI.ai_config import GEMINI_IMAGE_AI, MODEL_TIERS
+from AI.gateway import gateway
+from AI.post_processor import post_processor
+from AI.response_cache import response_cache
+from AI.image_cache import image_cache
 from uuid import uuid4
 from PIL import Image
 from io import BytesIO
 from google.genai import types
 from AI.text_ai import TextAIHandler
 import asyncio
+import json
 import os
+import re
 from logger_config import logger
 from dotenv import load_dotenv
-from utils import async_wrap_blocking
+from utils import run_blocking
 from typing import Optional
+from functools import partial
 
 load_dotenv()
 
 BOT_NAME = os.getenv("BOT_NAME")
 
+IMAGE_GENERATION_MODEL = "gemini-2.0-flash-exp-image-generation"
+
+# Answer image uploads with one multimodal call (image bytes inline plus the
+# reply prompt) instead of upload + describe + reply.
+IMAGE_FUSED_ANALYSIS = os.getenv("IMAGE_FUSED_ANALYSIS", "true").lower() == "true"
+# Larger images use the upload-based path (inline requests are capped at 20 MB).
+IMAGE_INLINE_MAX_BYTES = int(
+    os.getenv("IMAGE_INLINE_MAX_BYTES", str(15 * 1024 * 1024))
+)
+
+# Stands in for the separate analysis when the image itself is attached.
+INLINE_IMAGE_ANALYSIS = "(The image is attached to this message, analyze it directly.)"
+
+DEFAULT_ANALYSIS_PROMPT = "What describes on the photo?"
+
+# Image formats (as detected by PIL) Gemini accepts inline, and the MIME type to
+# send them as. MPO is a multi-picture JPEG produced by many phone cameras.
+INLINE_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "mpo": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "heic": "image/heic",
+    "heif": "image/heif",
+}
+
+JSON_OUTPUT = {"response_mime_type": "application/json"}
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def save_image(data: bytes, path: str) -> None:
+    """
+    Decodes image bytes and saves them as a PNG file.
+
+    Args:
+        data (bytes): Encoded image returned by the model.
+        path (str): Destination file path.
+    """
+    Image.open(BytesIO(data)).save(path)
+
+
+def read_image(path: str) -> tuple:
+    """
+    Reads an image file and detects its MIME type from the content.
+
+    Args:
+        path (str): Path to the image file.
+
+    Returns:
+        tuple: (image bytes, MIME type such as "image/png", or None when the
+            format cannot be sent inline)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    with Image.open(BytesIO(data)) as image:
+        image_format = (image.format or "").lower()
+    return data, INLINE_MIME_TYPES.get(image_format)
+
 
 class ImageAIHandler:
     """Handles image generation and analysis using Gemini AI models."""
@@ -41,10 +106,11 @@ class ImageAIHandler:
             text_ = await self.render_image_prompt(prompt_text, user_id)
 
             try:
-                response = await asyncio.wait_for(
-                    async_wrap_blocking(
-                        GEMINI_IMAGE_AI.models.generate_content,
-                        model="gemini-2.0-flash-exp-image-generation",
+                response = await gateway.call(
+                    IMAGE_GENERATION_MODEL,
+                    partial(
+                        GEMINI_IMAGE_AI.aio.models.generate_content,
+                        model=IMAGE_GENERATION_MODEL,
                         contents=text_,
                         config=types.GenerateContentConfig(
                             response_modalities=["Text", "Image"]
@@ -62,10 +128,13 @@ class ImageAIHandler:
 
             for part in response.candidates[0].content.parts:
                 if part.inline_data is not None:
-                    image = Image.open(BytesIO(part.inline_data.data))
                     image_path = f"./media/out/{uuid4()}.png"
-                    image.save(image_path)
-                    await self.db.save_history(user_id, prompt_text, "")
+                    await run_blocking(
+                        "cpu", save_image, part.inline_data.data, image_path
+                    )
+                    await post_processor.submit(
+                        user_id, prompt_text, "", shorten=False
+                    )
                     return image_path
 
             logger.error("⚠️ Image part not found in the response.")
@@ -75,38 +144,168 @@ class ImageAIHandler:
             logger.error(f"🚨 Gemini error during image generation: {e}")
             return None
 
+    async def lookup_analysis(self, path: str, prompt: str) -> tuple:
+        """
+        Reads an image and looks its analysis up in the image cache.
+
+        Args:
+            path (str): Path to the image file.
+            prompt (str): Analysis prompt.
+
+        Returns:
+            tuple: (cached analysis or None, image bytes, MIME type, cache
+                fingerprint); the last three are None if the image could not
+                be read, and the MIME type is None if it cannot be sent inline.
+        """
+        try:
+            data, mime_type = await run_blocking("cpu", read_image, path)
+            fp = await image_cache.fingerprint(data, prompt)
+            return await image_cache.get(fp), data, mime_type, fp
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache lookup failed: {e}")
+            return None, None, None, None
+
     async def get_analyze_image(
-        self, path: str, prompt: str = "What describes on the photo?"
+        self,
+        path: str,
+        prompt: str = DEFAULT_ANALYSIS_PROMPT,
+        fp: Optional[tuple] = None,
     ) -> str:
         """
-        Analyzes an uploaded image and returns a text description.
+        Analyzes an uploaded image and returns a text description. Images
+        analyzed before with the same prompt are answered from the image cache.
 
         Args:
             path (str): Path to the image file.
             prompt (str, optional): Custom prompt for analysis.
+            fp (tuple, optional): Cache fingerprint when the caller already
+                checked the cache (and missed).
 
         Returns:
             str: Analysis result or error message.
         """
         try:
-            file_ref = await async_wrap_blocking(
-                GEMINI_IMAGE_AI.files.upload, file=path
-            )
+            if fp is None:
+                cached, _, _, fp = await self.lookup_analysis(path, prompt)
+                if cached is not None:
+                    logger.info(f"📷 Image analysis (cached): {cached}")
+                    return cached
+
+            tier = gateway.tier_for("image_analysis")
+            model = MODEL_TIERS[tier]["model"]
+
+            async def analyze():
+                # The upload is an upstream request too, so it shares the
+                # tier's limits, retries and circuit breaker.
+                file_ref = await GEMINI_IMAGE_AI.aio.files.upload(file=path)
+                return await GEMINI_IMAGE_AI.aio.models.generate_content(
+                    model=model, contents=[prompt, file_ref]
+                )
 
-            response = await async_wrap_blocking(
-                GEMINI_IMAGE_AI.models.generate_content,
-                model="gemini-2.0-flash", # gemini-1.5-flash
-                contents=[prompt, file_ref],
-            )
+            response = await gateway.call(tier, analyze)
 
             logger.info(f"📷 Image analysis: {response.text}")
+            if fp is not None:
+                await image_cache.put(fp, response.text)
             return response.text
 
         except Exception as e:
             logger.error(f"🚨 Error analyzing image: {e}")
-            os.remove(path)
+            # The caller removes the file once it is done with it.
             return "Error analyzing image."
 
+    async def reply_to_image(self, path: str, user_id: int, content: str = "") -> str:
+        """
+        Answers an uploaded image (and the user's comment on it). A cached
+        analysis of the same image skips the vision model entirely; otherwise
+        a single multimodal call is made, falling back to analysis + reply if
+        that fails.
+
+        Args:
+            path (str): Path to the image file.
+            user_id (int): Discord user ID.
+            content (str, optional): The user's comment on the image.
+
+        Returns:
+            str: AI-generated reply.
+        """
+        analysis_prompt = content or DEFAULT_ANALYSIS_PROMPT
+        cached, data, mime_type, fp = await self.lookup_analysis(path, analysis_prompt)
+        if cached is not None:
+            return await self.get_results_analyzing_image(cached, user_id, content)
+
+        # Formats Gemini does not accept inline (GIF, BMP, ...) go through the
+        # upload-based analysis.
+        if IMAGE_FUSED_ANALYSIS and data is not None and mime_type is not None:
+            try:
+                reply = await self.get_fused_image_reply(
+                    data, mime_type, user_id, content, fp
+                )
+                if reply:
+                    return reply
+            except Exception as e:
+                logger.warning(f"⚠️ Fused image reply failed, using two calls: {e}")
+
+        analyzing_image = await self.get_analyze_image(path, analysis_prompt, fp)
+        return await self.get_results_analyzing_image(analyzing_image, user_id, content)
+
+    async def get_fused_image_reply(
+        self,
+        data: bytes,
+        mime_type: str,
+        user_id: int,
+        content: str = "",
+        fp: Optional[tuple] = None,
+    ) -> Optional[str]:
+        """
+        Sends the image bytes inline together with the rendered
+        image_analyze_prompt, so the model sees the image and writes the reply
+        in one request. The model also returns a description of the image,
+        which is stored in the image cache.
+
+        Args:
+            data (bytes): Encoded image.
+            mime_type (str): MIME type of the image.
+            user_id (int): Discord user ID.
+            content (str, optional): The user's comment on the image.
+            fp (tuple, optional): Image cache fingerprint for the description.
+
+        Returns:
+            Optional[str]: The reply, or None if the image is too large to inline.
+        """
+        if len(data) > IMAGE_INLINE_MAX_BYTES:
+            return None
+
+        user_nickname = await self.db.get_user_nick(user_id)
+        prompt = format_prompt(
+            "image_analyze_prompt",
+            BOT_NAME=BOT_NAME,
+            content=content,
+            prompt=INLINE_IMAGE_ANALYSIS,
+            user_nickname=user_nickname,
+        )
+        output_format = format_prompt(
+            "image_fused_output",
+            prompt=content or DEFAULT_ANALYSIS_PROMPT,
+            user_nickname=user_nickname,
+        )
+        response = await gateway.generate(
+            [{"mime_type": mime_type, "data": data}, f"{prompt}\n\n{output_format}"],
+            route="image_analyze_prompt",
+            generation_config=JSON_OUTPUT,
+        )
+        try:
+            result = json.loads(CODE_FENCE.sub("", response.text.strip()))
+            reply = str(result.get("reply") or "").strip()
+            description = str(result.get("description") or "").strip()
+        except (ValueError, AttributeError):
+            reply, description = response.text.strip(), ""
+        if description and fp is not None:
+            await image_cache.put(fp, description)
+        if reply:
+            await post_processor.submit(user_id, f"[image] {content}".strip(), reply)
+        return reply
+
     async def get_results_analyzing_image(
         self, prompt_text: str, user_id: int, content: str = ""
     ) -> str:
@@ -132,11 +331,8 @@ class ImageAIHandler:
                 user_nickname=user_nickname,
             )
 
-            response = await async_wrap_blocking(
-                GEMINI_AI.generate_content, contents=prompt
-            )
-            short_response = await self.textai_handler.get_ai_short_response(response)
-            await self.db.save_history(user_id, short_response, short_response)
+            response = await gateway.generate(prompt, route="image_analyze_prompt")
+            await post_processor.submit(user_id, prompt_text, response.text)
 
             return response.text.strip()
 
@@ -156,13 +352,13 @@ class ImageAIHandler:
             bool: True if image generation is needed, False otherwise.
         """
         try:
-            messages = await self.db.fetch_user_messages(user_id, 3)
+            messages = await self.textai_handler.get_context_messages(
+                user_id, prompt_text, recent=3, related=2
+            )
             prompt = format_prompt(
                 "image_request", messages=messages, prompt=prompt_text
             )
-            result = await async_wrap_blocking(
-                GEMINI_AI.generate_content, contents=prompt
-            )
+            result = await gateway.generate(prompt, route="image_request")
 
             logger.info(f"🤖 Image request decision: {result.text}")
             return "yes" in result.text.strip().lower()
@@ -184,14 +380,10 @@ class ImageAIHandler:
         """
         try:
             template_key = "image_success" if success else "image_failure"
-            formatted_prompt = format_prompt(template_key, prompt=prompt)
-
-            response = await async_wrap_blocking(
-                GEMINI_AI.generate_content, contents=formatted_prompt
-            )
+            text = await response_cache.generate(template_key, prompt=prompt)
 
-            logger.info(f"🖼️ Image response: {response.text.strip()}")
-            return response.text.strip()
+            logger.info(f"🖼️ Image response: {text}")
+            return text
         except Exception as e:
             logger.error(f"🚨 Error generating image text: {e}")
             return "Image generation is complete."
@@ -208,16 +400,14 @@ class ImageAIHandler:
             str: Detailed image generation prompt.
         """
         try:
-            history = await self.db.fetch_user_messages(user_id)
+            history = await self.textai_handler.get_context_messages(user_id, text)
             history_text = "\n".join([f"- {msg}" for msg in history])
 
             prompt = format_prompt(
                 "render_image_prompt", history_text=history_text, text=text
             )
 
-            response = await async_wrap_blocking(
-                GEMINI_AI.generate_content, contents=prompt
-            )
+            response = await gateway.generate(prompt, route="render_image_prompt")
             return response.text
 
         except Exception as e:
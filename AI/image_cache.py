@@ -0,0 +1,245 @@
+"""
+Content-hash cache of image analyses.
+
+Entries are keyed by the SHA-256 of the image bytes plus the analysis prompt
+and live in an in-memory LRU (first tier) backed by the
+`image_analysis_cache` SQLite table (second tier, least recently used rows
+pruned). Optionally, re-encoded or resized copies of a cached image can be
+matched as well: every entry also stores a 64-bit difference hash (dHash) and
+the image size, and a miss on the exact key falls back to the closest dHash
+within `max_distance` bits among the entries in memory for the same prompt
+whose aspect ratio matches. dHash ignores fine detail such as text, so this
+tier is off by default.
+"""
+
+import hashlib
+from collections import OrderedDict, defaultdict
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from AI.ai_config import (
+    IMAGE_CACHE_DB_ROWS,
+    IMAGE_CACHE_ENABLED,
+    IMAGE_CACHE_MAX_DISTANCE,
+    IMAGE_CACHE_MEMORY_SIZE,
+    IMAGE_CACHE_NEAR_DUPLICATES,
+)
+from database.db import DatabaseManager
+from logger_config import logger
+from utils import run_blocking
+
+# Number of SQLite writes between two size-bound prunes of the second tier.
+PRUNE_EVERY_WRITES = 100
+# Largest relative difference of the aspect ratios of two near duplicates.
+ASPECT_TOLERANCE = 0.01
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Computes the 64-bit difference hash of an image: the brightness gradient
+    between neighbouring pixels of a 9x8 grayscale thumbnail.
+
+    Args:
+        image (Image.Image): Decoded image.
+
+    Returns:
+        int: The hash.
+    """
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left > pixels[row * 9 + col + 1])
+    return value
+
+
+def same_shape(size: Optional[tuple], other: Optional[tuple]) -> bool:
+    """
+    Returns:
+        bool: Whether two (width, height) sizes have the same aspect ratio.
+    """
+    if not size or not other or not size[1] or not other[1]:
+        return False
+    ratio, other_ratio = size[0] / size[1], other[0] / other[1]
+    return abs(ratio - other_ratio) <= ASPECT_TOLERANCE * ratio
+
+
+def fingerprint(data: bytes, prompt: str, near_duplicates: bool = True) -> tuple:
+    """
+    Hashes an image and its analysis prompt (CPU-bound, run it off the loop).
+
+    Args:
+        data (bytes): Encoded image.
+        prompt (str): Analysis prompt.
+        near_duplicates (bool): Whether to compute the dHash and size as well.
+
+    Returns:
+        tuple: (key, prompt_key, dhash or None, (width, height) or None)
+    """
+    prompt_key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(data + b"\0" + prompt.encode("utf-8")).hexdigest()
+    hash_, size = None, None
+    if near_duplicates:
+        try:
+            with Image.open(BytesIO(data)) as image:
+                hash_, size = dhash(image), image.size
+        except Exception:
+            pass
+    return key, prompt_key, hash_, size
+
+
+class ImageAnalysisCache:
+    """LRU + SQLite cache of image analyses with a near-duplicate tier."""
+
+    def __init__(
+        self,
+        memory_size: int = IMAGE_CACHE_MEMORY_SIZE,
+        db_rows: int = IMAGE_CACHE_DB_ROWS,
+        enabled: bool = IMAGE_CACHE_ENABLED,
+        near_duplicates: bool = IMAGE_CACHE_NEAR_DUPLICATES,
+        max_distance: int = IMAGE_CACHE_MAX_DISTANCE,
+    ):
+        """
+        Args:
+            memory_size (int): Maximum number of entries in the in-memory tier.
+            db_rows (int): Maximum number of entries kept in SQLite.
+            enabled (bool): When False every lookup is a miss and nothing is stored.
+            near_duplicates (bool): Match images by dHash when the exact key misses.
+            max_distance (int): Largest dHash Hamming distance of a near duplicate.
+        """
+        self.db = DatabaseManager()
+        self.memory_size = memory_size
+        self.db_rows = db_rows
+        self.enabled = enabled
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # key -> (prompt_key, dhash, size, analysis)
+        self._loaded = False
+        self._writes = 0
+        self.counters = defaultdict(int)
+
+    def _remember(
+        self,
+        key: str,
+        prompt_key: str,
+        hash_: Optional[int],
+        size: Optional[tuple],
+        analysis: str,
+    ) -> None:
+        self._entries[key] = (prompt_key, hash_, size, analysis)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.memory_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self) -> None:
+        """Fills the memory tier with the most recently used rows once, so
+        near duplicates are found right after a restart."""
+        self._loaded = True
+        rows = await self.db.get_recent_image_analyses(self.memory_size)
+        for key, prompt_key, hash_hex, width, height, analysis in reversed(rows):
+            hash_ = int(hash_hex, 16) if hash_hex else None
+            size = (width, height) if width and height else None
+            self._remember(key, prompt_key, hash_, size, analysis)
+
+    def _nearest(self, prompt_key: str, hash_: int, size: tuple) -> Optional[str]:
+        """Returns the key of the closest in-memory dHash for the same prompt
+        among the entries with the same aspect ratio."""
+        best, best_distance = None, self.max_distance + 1
+        for key, (entry_prompt, entry_hash, entry_size, _) in self._entries.items():
+            if entry_prompt != prompt_key or entry_hash is None:
+                continue
+            if not same_shape(size, entry_size):
+                continue
+            distance = (entry_hash ^ hash_).bit_count()
+            if distance < best_distance:
+                best, best_distance = key, distance
+        return best
+
+    async def fingerprint(self, data: bytes, prompt: str) -> tuple:
+        """
+        Args:
+            data (bytes): Encoded image.
+            prompt (str): Analysis prompt.
+
+        Returns:
+            tuple: (key, prompt_key, dhash or None, size or None), see
+                `fingerprint`.
+        """
+        return await run_blocking(
+            "cpu", fingerprint, data, prompt, self.near_duplicates
+        )
+
+    async def get(self, fp: tuple) -> Optional[str]:
+        """
+        Looks an analysis up by exact key in memory, then in SQLite, then (if
+        enabled) by dHash and aspect ratio among the entries in memory.
+
+        Args:
+            fp (tuple): Result of `fingerprint`.
+
+        Returns:
+            Optional[str]: The cached analysis, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        key, prompt_key, hash_, size = fp
+        if not self._loaded:
+            await self._load()
+
+        item = self._entries.get(key)
+        if item is not None:
+            self._entries.move_to_end(key)
+            self.counters["memory"] += 1
+            return item[3]
+
+        analysis = await self.db.get_image_analysis(key)
+        if analysis is not None:
+            self._remember(key, prompt_key, hash_, size, analysis)
+            self.counters["db"] += 1
+            return analysis
+
+        if self.near_duplicates and hash_ is not None:
+            near_key = self._nearest(prompt_key, hash_, size)
+            if near_key is not None:
+                self._entries.move_to_end(near_key)
+                self.counters["near"] += 1
+                return self._entries[near_key][3]
+
+        self.counters["miss"] += 1
+        return None
+
+    async def put(self, fp: tuple, analysis: str) -> None:
+        """
+        Stores an analysis in both tiers.
+
+        Args:
+            fp (tuple): Result of `fingerprint`.
+            analysis (str): Analysis text.
+        """
+        if not self.enabled or not analysis:
+            return
+        key, prompt_key, hash_, size = fp
+        self._remember(key, prompt_key, hash_, size, analysis)
+        hash_hex = f"{hash_:016x}" if hash_ is not None else None
+        try:
+            await self.db.save_image_analysis(
+                key, prompt_key, hash_hex, size, analysis
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY_WRITES == 0:
+                await self.db.prune_image_analysis_cache(self.db_rows)
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache write failed: {e}")
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Hit ("memory", "db", "near") and "miss" counters.
+        """
+        return dict(self.counters)
+
+
+image_cache = ImageAnalysisCache()
@@ -0,0 +1,223 @@
+"""
+Write-behind post-processing of finished replies.
+
+Handlers send the Discord reply as soon as the model has answered and hand the
+rest to `post_processor`: shortening the reply for history, saving the turn,
+bumping the user's response counter and any follow-up work (such as the
+memory refresh). A single worker drains the bounded queue in batches, writing
+each batch in one transaction (one per job if the batch keeps failing), and
+the queue is flushed on shutdown.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from AI.response_cache import response_cache
+from AI.summarizer import extractive_summary
+from database.db import DatabaseManager
+from logger_config import logger
+
+load_dotenv()
+
+POSTPROCESS_QUEUE_SIZE = int(os.getenv("POSTPROCESS_QUEUE_SIZE", "1000"))
+POSTPROCESS_BATCH_SIZE = int(os.getenv("POSTPROCESS_BATCH_SIZE", "50"))
+POSTPROCESS_FLUSH_TIMEOUT = float(os.getenv("POSTPROCESS_FLUSH_TIMEOUT", "30"))
+
+# How replies are shortened before they are stored in history: "extractive"
+# (local, no model call) or "llm" (the short_response prompt).
+SHORT_RESPONSE_MODE = os.getenv("SHORT_RESPONSE_MODE", "extractive").lower()
+SHORT_RESPONSE_MAX_CHARS = int(os.getenv("SHORT_RESPONSE_MAX_CHARS", "600"))
+
+
+async def shorten_reply(text) -> str:
+    """
+    Shortens a reply for storage in history.
+
+    Args:
+        text: Reply text (a raw model response object is accepted as well).
+
+    Returns:
+        str: The shortened reply.
+    """
+    text = getattr(text, "text", text)
+    if SHORT_RESPONSE_MODE != "llm":
+        return extractive_summary(text, max_chars=SHORT_RESPONSE_MAX_CHARS)
+    return await response_cache.generate("short_response", prompt=text)
+
+
+class PostProcessor:
+    """Bounded background queue persisting turns and counters in batches."""
+
+    def __init__(
+        self,
+        max_size: int = POSTPROCESS_QUEUE_SIZE,
+        batch_size: int = POSTPROCESS_BATCH_SIZE,
+    ):
+        """
+        Args:
+            max_size (int): Queue capacity; `submit` waits while it is full.
+            batch_size (int): Maximum number of jobs written per transaction.
+        """
+        self.db = DatabaseManager()
+        self.batch_size = max(1, batch_size)
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._worker = None
+
+    def start(self) -> None:
+        """Starts the worker task if it is not running yet."""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(
+        self,
+        user_id,
+        message: Optional[str] = None,
+        response=None,
+        shorten: bool = True,
+        count_response: bool = False,
+        after_save: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Queues the post-processing of a reply.
+
+        Args:
+            user_id (int | str): Discord user ID.
+            message (str, optional): User message of the turn to save.
+            response (str, optional): Reply of the turn; no turn is saved when None.
+            shorten (bool): Shorten the reply before saving it.
+            count_response (bool): Increment the user's response counter.
+            after_save (Callable, optional): Coroutine function awaited once
+                the batch containing this job is committed.
+        """
+        self.start()
+        await self._queue.put(
+            (user_id, message, response, shorten, count_response, after_save)
+        )
+
+    async def _run(self) -> None:
+        """Worker loop: takes one job, then whatever else is already queued."""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.error(f"🚨 Post-processing of {len(batch)} job(s) failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch: list) -> None:
+        """
+        Shortens, saves and counts one batch of jobs in a single transaction.
+
+        Args:
+            batch (list): Queued job tuples.
+        """
+        jobs = [await self._prepare(job) for job in batch]
+        saved = await self._save(jobs)
+
+        for *_, after_save in saved:
+            if after_save is not None:
+                try:
+                    await after_save()
+                except Exception as e:
+                    logger.error(f"🚨 Post-save hook failed: {e}")
+
+    @staticmethod
+    async def _prepare(job: tuple) -> tuple:
+        """
+        Shortens the reply of a queued job.
+
+        Args:
+            job (tuple): Queued job tuple.
+
+        Returns:
+            tuple: (user_id, history row or None, count_response, after_save)
+        """
+        user_id, message, response, shorten, count_response, after_save = job
+        if response is None:
+            return user_id, None, count_response, after_save
+        if shorten:
+            try:
+                response = await shorten_reply(response)
+            except Exception as e:
+                logger.error(f"🚨 Error shortening reply: {e}")
+                response = getattr(response, "text", response)
+        return user_id, (user_id, message or "", response), count_response, after_save
+
+    async def _write(self, jobs: list) -> None:
+        """
+        Saves the turns and bumps the counters of prepared jobs in one transaction.
+
+        Args:
+            jobs (list): Results of `_prepare`.
+        """
+        async with self.db.transaction():
+            await self.db.save_history_many([row for _, row, _, _ in jobs if row])
+            for user_id, _, count_response, _ in jobs:
+                if count_response:
+                    await self.db.success_response(user_id)
+
+    async def _save(self, jobs: list) -> list:
+        """
+        Writes prepared jobs in one transaction, retried once. If that keeps
+        failing, each job is written on its own so one bad job (or a busy
+        database) cannot discard the other users' turns.
+
+        Args:
+            jobs (list): Results of `_prepare`.
+
+        Returns:
+            list: The jobs that were written.
+        """
+        for attempt in (1, 2):
+            try:
+                await self._write(jobs)
+                return jobs
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ Writing {len(jobs)} post-processed job(s) failed "
+                    f"(attempt {attempt}): {e}"
+                )
+        if len(jobs) == 1:
+            logger.error(f"🚨 Post-processing of user {jobs[0][0]} dropped.")
+            return []
+
+        saved = []
+        for job in jobs:
+            try:
+                await self._write([job])
+                saved.append(job)
+            except Exception as e:
+                logger.error(f"🚨 Post-processing of user {job[0]} failed: {e}")
+        return saved
+
+    async def close(self, timeout: float = POSTPROCESS_FLUSH_TIMEOUT) -> None:
+        """
+        Flushes the queue and stops the worker. Called once on bot shutdown.
+
+        Args:
+            timeout (float): Seconds to wait for queued jobs to be written.
+        """
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⚠️ {self._queue.qsize()} post-processing job(s) dropped on shutdown."
+            )
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+
+post_processor = PostProcessor()
@@ -0,0 +1,217 @@
+"""
+Two-tier cache for LLM responses of deterministic prompt templates.
+
+Callers opt in per template by going through `response_cache.generate`
+instead of formatting the prompt and calling the gateway themselves. Entries
+are keyed by the template name plus its arguments (whitespace-normalised
+only for prose templates, see `NORMALISED_TEMPLATES`) and live in an
+in-memory LRU (first tier) backed by the `response_cache` SQLite table
+(second tier). Each template has its own TTL in `TEMPLATE_TTLS`.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+from AI.ai_config import (
+    RESPONSE_CACHE_DB_ROWS,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MEMORY_SIZE,
+)
+from AI.gateway import gateway
+from database.db import DatabaseManager
+from logger_config import logger
+from prompt import format_prompt_parts
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Lifetime of a cached response per template, in seconds. Templates that are
+# not listed here are never cached.
+TEMPLATE_TTLS = {
+    "short_response": 7 * DAY,
+    "optimize_query": DAY,
+    "detect_voice": 30 * DAY,
+    "photolab": DAY,
+    "explain_code": 7 * DAY,
+    "image_success": DAY,
+    "image_failure": DAY,
+}
+
+# Templates whose arguments are prose, so whitespace differences do not change
+# the answer and are collapsed before hashing. Arguments of every other
+# template (e.g. code for explain_code) are hashed verbatim.
+NORMALISED_TEMPLATES = {
+    "short_response",
+    "optimize_query",
+    "detect_voice",
+    "photolab",
+    "image_success",
+    "image_failure",
+}
+
+# Number of SQLite writes between two size-bound prunes of the second tier.
+PRUNE_EVERY_WRITES = 200
+
+
+def _normalise(value) -> str:
+    """
+    Collapses whitespace so trivially different inputs share one entry.
+
+    Args:
+        value: Template argument.
+
+    Returns:
+        str: Normalised text.
+    """
+    return " ".join(str(value).split())
+
+
+class ResponseCache:
+    """LRU + SQLite cache of LLM responses with per-template TTLs."""
+
+    def __init__(
+        self,
+        memory_size: int = RESPONSE_CACHE_MEMORY_SIZE,
+        db_rows: int = RESPONSE_CACHE_DB_ROWS,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+    ):
+        """
+        Args:
+            memory_size (int): Maximum number of entries in the in-memory tier.
+            db_rows (int): Maximum number of entries kept in SQLite.
+            enabled (bool): When False every lookup is a miss and nothing is stored.
+        """
+        self.db = DatabaseManager()
+        self.memory_size = memory_size
+        self.db_rows = db_rows
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._writes = 0
+        self.counters = defaultdict(lambda: {"memory": 0, "db": 0, "miss": 0})
+
+    @staticmethod
+    def make_key(template: str, args: dict) -> str:
+        """
+        Builds the cache key of a template call.
+
+        Args:
+            template (str): Prompt template name.
+            args (dict): Template arguments.
+
+        Returns:
+            str: SHA-256 hex digest of the template name and arguments
+                (normalised for templates in `NORMALISED_TEMPLATES`).
+        """
+        prepare = _normalise if template in NORMALISED_TEMPLATES else str
+        payload = json.dumps(
+            [template, sorted((k, prepare(v)) for k, v in args.items())],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, text: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.memory_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, template: str, key: str) -> Optional[str]:
+        """
+        Looks a response up in the memory tier, then in SQLite.
+
+        Args:
+            template (str): Prompt template name (for the counters).
+            key (str): Key from `make_key`.
+
+        Returns:
+            Optional[str]: The cached response, or None on a miss.
+        """
+        item = self._entries.get(key)
+        if item is not None:
+            if item[0] > time.time():
+                self._entries.move_to_end(key)
+                self.counters[template]["memory"] += 1
+                return item[1]
+            del self._entries[key]
+
+        row = await self.db.get_cached_response(key)
+        if row is not None:
+            text, expires_at = row
+            self._remember(key, text, expires_at)
+            self.counters[template]["db"] += 1
+            return text
+
+        self.counters[template]["miss"] += 1
+        return None
+
+    async def put(self, template: str, key: str, text: str) -> None:
+        """
+        Stores a response in both tiers.
+
+        Args:
+            template (str): Prompt template name (selects the TTL).
+            key (str): Key from `make_key`.
+            text (str): Response text.
+        """
+        expires_at = time.time() + TEMPLATE_TTLS[template]
+        self._remember(key, text, expires_at)
+        await self.db.save_cached_response(key, template, text, expires_at)
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            await self.db.prune_response_cache(self.db_rows)
+
+    async def generate(
+        self,
+        template: str,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> str:
+        """
+        Formats a prompt template and returns the model's reply, served from
+        the cache when the same template was called with the same arguments.
+
+        Args:
+            template (str): Prompt template name, must be listed in `TEMPLATE_TTLS`.
+            timeout (float, optional): Timeout per upstream attempt in seconds;
+                the timeout of the template's model tier when omitted.
+            **kwargs: Template arguments.
+
+        Returns:
+            str: The stripped response text.
+        """
+        system, prompt = format_prompt_parts(template, **kwargs)
+        if not self.enabled or template not in TEMPLATE_TTLS:
+            return await gateway.generate_text(
+                prompt, route=template, timeout=timeout, system_instruction=system
+            )
+
+        key = self.make_key(template, kwargs)
+        try:
+            cached = await self.get(template, key)
+        except Exception as e:
+            logger.warning(f"⚠️ Response cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        text = await gateway.generate_text(
+            prompt, route=template, timeout=timeout, system_instruction=system
+        )
+        try:
+            await self.put(template, key, text)
+        except Exception as e:
+            logger.warning(f"⚠️ Response cache write failed: {e}")
+        return text
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Per-template hit ("memory", "db") and "miss" counters.
+        """
+        return {template: dict(counts) for template, counts in self.counters.items()}
+
+
+response_cache = ResponseCache()
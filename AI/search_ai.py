@@ -6,11 +6,13 @@ from bs4 import BeautifulSoup
 from database.db import DatabaseManager
 from AI.text_ai import TextAIHandler
 from prompt import format_prompt
-from AI.ai_config import GEMINI_AI
+from AI.gateway import gateway
+from AI.post_processor import post_processor
+from AI.response_cache import response_cache
 from googlesearch import search
 from logger_config import logger
 import undetected_chromedriver as uc
-from utils import async_wrap_blocking
+from utils import run_blocking
 from typing import List
 
 USER_AGENTS = [
@@ -39,13 +41,8 @@ class SmartGoogleSearcher:
         Returns:
             str: Optimized query string.
         """
-        prompt = f"Optimize the following question into a clean, short search engine query:\n\n{query}\n\nResult:"
         try:
-            optimized = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=10,
-            )
-            return optimized.text.strip()
+            return await response_cache.generate("optimize_query", query=query)
         except Exception as e:
             logger.error(f"🚨 Query optimization failed: {e}")
             return query
@@ -62,8 +59,8 @@ class SmartGoogleSearcher:
         """
         results = []
         try:
-            search_results = await async_wrap_blocking(
-                search, query, num_results=self.max_results
+            search_results = await run_blocking(
+                "io", search, query, num_results=self.max_results
             )
             for url in search_results:
                 if url.startswith("http"):
@@ -86,21 +83,30 @@ class SmartGoogleSearcher:
         Returns:
             List[str]: List of found URLs.
         """
-        results = []
-        try:
+        def scrape():
+            results = []
             options = uc.ChromeOptions(version_main=136)
             options.add_argument("--headless")
-            driver = await async_wrap_blocking(uc.Chrome, options=options)
-            driver.get(f"https://www.google.com/search?q={urllib.parse.quote(query)}")
-            links = driver.find_elements("css selector", "div.yuRUbf > a")
-            for link in links[: self.max_results]:
-                href = link.get_attribute("href")
-                if href and href.startswith("http"):
-                    results.append(href)
-            driver.quit()
+            driver = uc.Chrome(options=options)
+            try:
+                driver.get(
+                    f"https://www.google.com/search?q={urllib.parse.quote(query)}"
+                )
+                links = driver.find_elements("css selector", "div.yuRUbf > a")
+                for link in links[: self.max_results]:
+                    href = link.get_attribute("href")
+                    if href and href.startswith("http"):
+                        results.append(href)
+            finally:
+                driver.quit()
+            return results
+
+        try:
+            # The whole browser session blocks, not just starting Chrome.
+            return await run_blocking("browser", scrape)
         except Exception as e:
             logger.error(f"🚨 Chromedriver search error: {e}")
-        return results
+            return []
 
     async def bing_search(self, query: str) -> List[str]:
         """
@@ -208,26 +214,26 @@ class SmartGoogleSearcher:
             )
 
             nickname = await self.db.get_user_nick(user_id)
+            context = await self.textai_handler.get_context_messages(
+                user_id, query, recent=0, related=3
+            )
 
             prompt_ = format_prompt(
                 "search_prompt",
                 results=combined_summary,
                 nickname=nickname,
                 query=query,
+                context="\n".join(f"- {msg}" for msg in context),
             )
             try:
-                response = await asyncio.wait_for(
-                    async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt_),
-                    timeout=25,
-                )
+                response = await gateway.generate(prompt_, route="search_prompt")
             except asyncio.TimeoutError:
                 logger.error(
                     "⏰ Gemini content generation timeout during smart search."
                 )
                 return "⏰ Search summary generation timed out."
 
-            short_response = await self.textai_handler.get_ai_short_response(response)
-            await self.db.save_history(user_id, query, short_response)
+            await post_processor.submit(user_id, query, response.text)
 
             return response.text.strip()
 
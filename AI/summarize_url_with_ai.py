@@ -1,12 +1,35 @@
 from AI.text_ai import TextAIHandler
-from utils import async_wrap_blocking
-from AI.ai_config import GEMINI_AI
+from AI.gateway import gateway
+from AI.post_processor import post_processor
 import undetected_chromedriver as uc
 from bs4 import BeautifulSoup
 from prompt import format_prompt
 from database.db import DatabaseManager
 from logger_config import logger
-import asyncio
+import time
+from utils import run_blocking
+
+
+def fetch_page_html(url: str) -> str:
+    """
+    Loads a page in a headless browser and returns its rendered HTML. The whole
+    browser session blocks, so run it on the "browser" executor.
+
+    Args:
+        url (str): Full URL of the page.
+
+    Returns:
+        str: Page source after scripts had a few seconds to run.
+    """
+    options = uc.ChromeOptions()
+    options.add_argument("--headless")
+    driver = uc.Chrome(options=options)
+    try:
+        driver.get(url)
+        time.sleep(3)
+        return driver.page_source
+    finally:
+        driver.quit()
 
 
 class SummarizeURL:
@@ -31,17 +54,10 @@ class SummarizeURL:
             str: A short, natural summary of the webpage content or an error message if failed.
         """
         try:
-            options = uc.ChromeOptions()
-            options.add_argument("--headless")
-            driver = uc.Chrome(options=options)
             if not url.startswith("http://") and not url.startswith("https://"):
                 url = "https://" + url
 
-            driver.get(url)
-            await asyncio.sleep(3)
-
-            html = driver.page_source
-            driver.quit()
+            html = await run_blocking("browser", fetch_page_html, url)
 
             soup = BeautifulSoup(html, "html.parser")
             paragraphs = soup.find_all("p")
@@ -56,14 +72,8 @@ class SummarizeURL:
                 content=content,
             )
 
-            ai_response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, prompt_), timeout=25
-            )
-            short_response = await self.textai_handler.get_ai_short_response(
-                ai_response
-            )
-
-            await self.db.save_history(user_id, url, short_response)
+            ai_response = await gateway.generate(prompt_, route="summarize_url_prompt")
+            await post_processor.submit(user_id, url, ai_response.text)
             return ai_response.text.strip()
 
         except Exception as e:
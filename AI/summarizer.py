@@ -0,0 +1,102 @@
+"""
+Local, deterministic extractive summariser.
+
+Used to shorten model replies before they are stored in history, without a
+second model round trip. Sentences are scored by the frequency of their
+content words across the whole text (with a bonus for the opening sentence
+and for sentences carrying numbers, formulas or code), the best ones are kept
+in their original order and the result is cut to a character budget.
+"""
+
+import math
+import re
+from collections import Counter
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+CODE_BLOCK = re.compile(r"```.*?```", re.DOTALL)
+WORD = re.compile(r"\w+", re.UNICODE)
+# Numbers, equations and inline code usually carry the actual answer.
+CRITICAL = re.compile(r"\d|[=+\-*/^<>]\s*\w|`")
+
+# Words this short are mostly function words in any language.
+MIN_WORD_LENGTH = 3
+
+
+def _segments(text: str) -> list:
+    """
+    Splits text into sentences, keeping fenced code blocks whole.
+
+    Args:
+        text (str): Text to split.
+
+    Returns:
+        list: Non-empty sentence strings in original order.
+    """
+    segments = []
+    position = 0
+    for match in CODE_BLOCK.finditer(text):
+        segments.extend(SENTENCE_SPLIT.split(text[position : match.start()]))
+        segments.append(match.group(0))
+        position = match.end()
+    segments.extend(SENTENCE_SPLIT.split(text[position:]))
+    return [s.strip() for s in segments if s and s.strip()]
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """
+    Cuts text to `max_chars` at a word boundary, marking the cut with "…".
+    """
+    if len(text) <= max_chars:
+        return text
+    cut = text[: max_chars - 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip() + "…"
+
+
+def extractive_summary(text: str, max_sentences: int = 5, max_chars: int = 600) -> str:
+    """
+    Builds a short summary from the most representative sentences of a text.
+
+    Args:
+        text (str): Text to summarise.
+        max_sentences (int): Maximum number of sentences kept.
+        max_chars (int): Maximum length of the summary.
+
+    Returns:
+        str: The summary (the text itself if it already fits).
+    """
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+
+    sentences = list(dict.fromkeys(_segments(text)))
+    tokens = [
+        [w for w in WORD.findall(s.lower()) if len(w) >= MIN_WORD_LENGTH]
+        for s in sentences
+    ]
+    frequencies = Counter(w for words in tokens for w in words)
+
+    scores = []
+    for index, (sentence, words) in enumerate(zip(sentences, tokens)):
+        score = sum(frequencies[w] for w in set(words)) / math.sqrt(len(words) + 1)
+        if index == 0:
+            score *= 1.5
+        if CRITICAL.search(sentence):
+            score *= 1.25
+        scores.append(score)
+
+    ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    chosen = []
+    length = 0
+    for index in ranked:
+        if len(chosen) >= max_sentences:
+            break
+        size = len(sentences[index]) + 1
+        if chosen and length + size > max_chars:
+            continue
+        chosen.append(index)
+        length += size
+
+    summary = " ".join(sentences[i] for i in sorted(chosen))
+    return _truncate(summary, max_chars)
@@ -1,20 +1,110 @@
-import json
-from prompt import format_prompt
-from AI.ai_config import GEMINI_AI
+from prompt import format_prompt, format_prompt_parts
+from AI.gateway import gateway
+from AI.post_processor import post_processor, shorten_reply
+from AI.response_cache import response_cache
 from database.db import DatabaseManager
-import requests
+from database.vector_store import vector_memory
 from datetime import datetime
+from functools import lru_cache
 import pytz
 from logger_config import logger
 from dotenv import load_dotenv
 import os
-from utils import async_wrap_blocking
+import weakref
+from itertools import zip_longest
+from utils import run_blocking
 import asyncio
+from typing import AsyncIterator, Optional
 
 load_dotenv()
 
 BOT_NAME = os.getenv("BOT_NAME")
 
+TEXT_RESPONSE_FALLBACK = "I'm a bit confused. I'll get better. 😍"
+
+# Prompt budget for past turns, in characters (roughly 4 characters per token).
+HISTORY_CHAR_BUDGET = int(os.getenv("HISTORY_CHAR_BUDGET", "12000"))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "40"))
+# Older turns outside the window pulled in by keyword and vector search.
+RECALL_TURNS = int(os.getenv("RECALL_TURNS", "4"))
+# Vector candidates fetched per recalled turn, so that rows archived or deleted
+# since they were embedded can be dropped without losing recall.
+RECALL_CANDIDATES_FACTOR = 3
+
+# The memory summary is refreshed in the background once this many new
+# messages have been saved, folding at most MEMORY_FOLD_BATCH rows per call.
+MEMORY_REFRESH_EVERY = int(os.getenv("MEMORY_REFRESH_EVERY", "20"))
+MEMORY_FOLD_BATCH = int(os.getenv("MEMORY_FOLD_BATCH", "200"))
+# A full batch plus the current summary is a long prompt, well past the fast
+# tier's default timeout (timeouts are not retried).
+MEMORY_FOLD_TIMEOUT = float(os.getenv("MEMORY_FOLD_TIMEOUT", "60"))
+
+# IANA name such as "Asia/Baku"; the system timezone is used when unset.
+SERVER_TIMEZONE = os.getenv("SERVER_TIMEZONE", "")
+
+_user_locks = weakref.WeakValueDictionary()
+_background_tasks = set()
+
+
+def _spawn(coro) -> None:
+    """Runs a coroutine as a background task that is kept alive until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _user_lock(kind: str, user_id) -> asyncio.Lock:
+    """Returns the lock that serialises one kind of per-user job (e.g. "memory")."""
+    key = (kind, str(user_id))
+    lock = _user_locks.get(key)
+    if lock is None:
+        lock = _user_locks[key] = asyncio.Lock()
+    return lock
+
+
+def _system_timezone_name() -> str:
+    """Returns the IANA name of the host's timezone, or "" if it cannot be found."""
+    try:
+        with open("/etc/timezone", "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        if name:
+            return name
+    except OSError:
+        pass
+    localtime = os.path.realpath("/etc/localtime")
+    if "zoneinfo/" in localtime:
+        return localtime.split("zoneinfo/", 1)[1]
+    return ""
+
+
+@lru_cache(maxsize=None)
+def server_timezone() -> str:
+    """
+    Resolves the timezone shown in prompts, once per process: SERVER_TIMEZONE,
+    then the TZ variable, then the system tz database, then UTC.
+
+    Returns:
+        str: Timezone name (e.g., "Asia/Baku").
+    """
+    candidates = [
+        SERVER_TIMEZONE,
+        os.getenv("TZ", "").lstrip(":"),
+        _system_timezone_name(),
+    ]
+    for name in candidates:
+        if name in pytz.all_timezones_set:
+            logger.info(f"🕒 Server timezone: {name}")
+            return name
+        if name:
+            logger.warning(f"⚠️ Ignoring unknown timezone '{name}'")
+    return "UTC"
+
+
+@lru_cache(maxsize=None)
+def _tzinfo(timezone_str: str):
+    """Returns the cached tzinfo object for a timezone name."""
+    return pytz.timezone(timezone_str)
+
 
 class TextAIHandler:
     """
@@ -25,7 +115,7 @@ class TextAIHandler:
 
     def __init__(self):
         self.db = DatabaseManager()
-        self.timezone = ""
+        self.timezone = server_timezone()
 
     async def generate_text_response(self, content: str, user_id: int) -> str:
         """
@@ -39,45 +129,242 @@ class TextAIHandler:
             str: AI-generated reply to the user's message.
         """
         try:
-            user_nickname = await self.db.get_user_nick(user_id)
-            history = await self.db.get_recent_history(user_id)
-
-            history_text = "\n".join(
-                [f"{user_nickname}: {m}\n{BOT_NAME}: {r}" for m, r in history]
+            system, prompt, user_nickname = await self.build_text_prompt(
+                content, user_id
+            )
+            response = await gateway.generate(
+                prompt, route="text_response", system_instruction=system
             )
+            full_response = response.text
+            await self.queue_text_turn(user_id, user_nickname, content, full_response)
+            return full_response.strip()
 
-            if not self.timezone:
-                self.timezone = await self.get_server_timezone()
+        except Exception as e:
+            logger.error(f"🚨 Error generating text response: {e}")
+            return TEXT_RESPONSE_FALLBACK
 
-            clock = await self.get_current_time_in_timezone(self.timezone)
+    async def stream_text_response(
+        self, content: str, user_id: int
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of `generate_text_response`: yields the reply in
+        pieces as Gemini produces them and queues the turn once it is complete.
 
-            prompt = format_prompt(
-                template_name="text_response",
-                BOT_NAME=BOT_NAME,
-                history_text=history_text,
-                content=content,
-                nickname=user_nickname,
-                time={clock},
-                zone={self.timezone},
-            )
+        Args:
+            content (str): The user's latest message or question.
+            user_id (int): Unique identifier for the user (from Discord).
 
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=25,
-            )
-            full_response = response.text
+        Yields:
+            str: Consecutive pieces of the reply.
 
-            if full_response.count(".") >= 5:
-                short_response = await self.get_ai_short_response(full_response)
-            else:
-                short_response = full_response
+        Raises:
+            Exception: Errors are left to the caller, which may already have
+                shown part of the reply.
+        """
+        system, prompt, user_nickname = await self.build_text_prompt(content, user_id)
+        parts = []
+        stream = gateway.stream(
+            prompt, route="text_response", system_instruction=system
+        )
+        try:
+            async for text in stream:
+                parts.append(text)
+                yield text
+        finally:
+            # Hands the tier slot back even if the caller stops iterating early.
+            await stream.aclose()
+        await self.queue_text_turn(user_id, user_nickname, content, "".join(parts))
+
+    async def build_text_prompt(self, content: str, user_id: int) -> tuple:
+        """
+        Renders the text_response prompt from the user's history window,
+        recalled turns and the current time. The static persona part is
+        returned separately, to be sent as the system instruction.
 
-            await self.db.save_history(user_id, content, short_response)
-            return full_response.strip()
+        Args:
+            content (str): The user's latest message or question.
+            user_id (int): Unique identifier for the user (from Discord).
 
+        Returns:
+            tuple: (system_instruction, prompt, user_nickname)
+        """
+        user_nickname = await self.db.get_user_nick(user_id)
+        history = await self.db.get_history_window(
+            user_id, max_chars=HISTORY_CHAR_BUDGET, max_turns=HISTORY_MAX_TURNS
+        )
+
+        history_text = "\n".join(
+            [f"{user_nickname}: {m}\n{BOT_NAME}: {r}" for _, m, r in history]
+        )
+        recalled_text = await self.get_recalled_text(
+            user_id, content, user_nickname, {row[0] for row in history}
+        )
+
+        clock = await self.get_current_time_in_timezone(self.timezone)
+
+        system, prompt = format_prompt_parts(
+            template_name="text_response",
+            BOT_NAME=BOT_NAME,
+            history_text=history_text,
+            recalled_text=recalled_text,
+            content=content,
+            nickname=user_nickname,
+            time=clock,
+            zone=self.timezone,
+        )
+        return system, prompt, user_nickname
+
+    async def queue_text_turn(
+        self, user_id, nickname: str, content: str, full_response: str
+    ) -> None:
+        """
+        Queues shortening, saving and the memory refresh of a finished turn,
+        so they run after the reply is sent.
+
+        Args:
+            user_id (int): Discord user ID.
+            nickname (str): Display name of the user.
+            content (str): The user's message.
+            full_response (str): The complete reply.
+        """
+        await post_processor.submit(
+            user_id,
+            content,
+            full_response,
+            shorten=full_response.count(".") >= 5,
+            after_save=lambda: self.maybe_refresh_memory(user_id, nickname),
+        )
+
+    async def sync_vector_memory(self, user_id) -> None:
+        """
+        Embeds the user's history rows that are not in the vector store yet.
+
+        Args:
+            user_id (int): Discord user ID.
+        """
+        async with _user_lock("vectors", user_id):
+            last_id = await run_blocking("io", vector_memory.last_indexed_id, user_id)
+            while True:
+                rows = await self.db.get_history_since(user_id, last_id, 500)
+                if not rows:
+                    return
+                await run_blocking(
+                    "cpu",
+                    vector_memory.add,
+                    user_id,
+                    [(i, f"{m or ''}\n{r or ''}") for i, m, r in rows],
+                )
+                last_id = rows[-1][0]
+
+    async def rebuild_vector_memory(self, user_id) -> None:
+        """
+        Drops the user's vector shard and re-embeds the live history, removing
+        rows that were archived or deleted since they were indexed.
+
+        Args:
+            user_id (int): Discord user ID.
+        """
+        try:
+            async with _user_lock("vectors", user_id):
+                await run_blocking("io", vector_memory.drop, user_id)
+            await self.sync_vector_memory(user_id)
+            logger.info(f"🧭 Rebuilt vector memory of user {user_id}.")
         except Exception as e:
-            logger.error(f"🚨 Error generating text response: {e}")
-            return "I'm a bit confused. I'll get better. 😍"
+            logger.error(f"Error rebuilding vector memory: {e}")
+
+    async def get_relevant_turns(
+        self, user_id, text: str, k: int, exclude_ids=()
+    ) -> list:
+        """
+        Picks the k past turns most relevant to the text, mixing vector
+        similarity and full-text keyword matches.
+
+        Args:
+            user_id (int): Discord user ID.
+            text (str): Text to find related turns for.
+            k (int): Maximum number of turns.
+            exclude_ids (Iterable[int]): History IDs already present in the prompt.
+
+        Returns:
+            list: (id, message, response) tuples ordered by ID.
+        """
+        if k <= 0 or not text:
+            return []
+        exclude_ids = set(exclude_ids)
+        await self.sync_vector_memory(user_id)
+        vector_hits = await run_blocking(
+            "cpu",
+            vector_memory.search,
+            user_id,
+            text,
+            k * RECALL_CANDIDATES_FACTOR,
+            exclude_ids,
+        )
+        keyword_hits = await self.db.search_history(
+            user_id, text, limit=k + len(exclude_ids)
+        )
+
+        vector_ids = [history_id for history_id, _ in vector_hits]
+        keyword_ids = [m["id"] for m in keyword_hits if m["id"] not in exclude_ids]
+        picked = []
+        for pair in zip_longest(vector_ids, keyword_ids):
+            for history_id in pair:
+                if history_id is not None and history_id not in picked:
+                    picked.append(history_id)
+
+        # The shard still holds rows that were archived or curated away; skip
+        # them here and rebuild it so they stop taking candidate slots.
+        live = {row[0]: row for row in await self.db.get_history_by_ids(picked)}
+        if any(history_id not in live for history_id in vector_ids):
+            if not _user_lock("vectors", user_id).locked():
+                _spawn(self.rebuild_vector_memory(user_id))
+        ranked = [history_id for history_id in picked if history_id in live][:k]
+        return sorted(live[history_id] for history_id in ranked)
+
+    async def get_context_messages(
+        self, user_id, text: str, recent: int = 3, related: int = 5
+    ) -> list:
+        """
+        Collects the user's last few messages plus the older ones most related
+        to the given text, for prompts that don't need the full conversation.
+
+        Args:
+            user_id (int): Discord user ID.
+            text (str): Text to find related messages for.
+            recent (int): Number of newest messages to always include.
+            related (int): Maximum number of related older messages.
+
+        Returns:
+            list: Message strings in chronological order.
+        """
+        window = await self.db.get_history_window(
+            user_id, max_chars=HISTORY_CHAR_BUDGET, max_turns=recent
+        )
+        turns = await self.get_relevant_turns(
+            user_id, text, related, {row[0] for row in window}
+        )
+        rows = sorted(turns + window, key=lambda row: row[0])
+        return [message for _, message, _ in rows if message]
+
+    async def get_recalled_text(
+        self, user_id, content: str, nickname: str, exclude_ids: set
+    ) -> str:
+        """
+        Finds older turns related to the current message.
+
+        Args:
+            user_id (int): Discord user ID.
+            content (str): The user's latest message.
+            nickname (str): Display name of the user.
+            exclude_ids (set): History IDs already present in the prompt.
+
+        Returns:
+            str: The related turns formatted like the history text, or "".
+        """
+        turns = await self.get_relevant_turns(
+            user_id, content, RECALL_TURNS, exclude_ids
+        )
+        return "\n".join(f"{nickname}: {m}\n{BOT_NAME}: {r}" for _, m, r in turns)
 
     async def get_facts(self, user_id: int) -> str:
         """
@@ -91,60 +378,127 @@ class TextAIHandler:
         """
         try:
             tip_prompt = format_prompt("get_facts")
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=tip_prompt),
-                timeout=20,
-            )
+            response = await gateway.generate(tip_prompt, route="get_facts", timeout=20)
             tip_response = response.text
-            short_response = await self.get_ai_short_response(tip_response)
-            await self.db.save_history(user_id, "", short_response)
+            await post_processor.submit(user_id, "", tip_response)
             return f"🧠 **Today's AI fact:**\n{tip_response.strip()}"
         except Exception:
             return "🤖 Oops! I couldn't find an AI fact at the moment. Please try again later 🌟📆"
 
     async def summarize_user_memory(self, user_id, nickname: str) -> str:
         """
-        Summarizes all saved messages for a given user into a concise memory.
+        Returns the user's stored memory summary (a single-row read). Messages
+        saved since it was last updated are folded in by a background refresh.
 
         Args:
             user_id (int): Discord user ID whose conversation history is being summarized.
+            nickname (str): Display name used when the history doesn't mention a name.
 
         Returns:
             str: A summary of the user's memory, or a default message if empty.
         """
-        full_text = await self.db.get_user_full_history(user_id)
-
-        if not full_text.strip():
-            return "I don't have anything about you in my memory. 😶"
-
-        prompt = format_prompt("memory_prompt", prompt=full_text, nickname=nickname)
         try:
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=20,
-            )
-            return response.text.strip()
-
+            summary, last_id = await self.db.get_memory_summary(user_id)
+            await self.maybe_refresh_memory(user_id, nickname, min_new_rows=1)
         except Exception as e:
             logger.error(f"Error summarizing memory: {e}")
             return "An error occurred while generating the summary."
 
+        if summary:
+            return summary
+        if await self.db.count_history_since(user_id, last_id):
+            return "Still putting together what I know about you, ask again soon. ⏳"
+        return "I don't have anything about you in my memory. 😶"
+
+    async def refresh_user_memory(self, user_id, nickname: str) -> Optional[str]:
+        """
+        Incrementally updates the stored memory summary with history rows newer
+        than its high-water mark, so the cost depends on new activity only.
+        Rows that were moved to the history archive before being folded in
+        are read from there first.
+
+        Args:
+            user_id (int): Discord user ID.
+            nickname (str): Display name of the user.
+
+        Returns:
+            Optional[str]: The up-to-date summary, or None if there is no history yet.
+        """
+        async with _user_lock("memory", user_id):
+            summary, last_id = await self.db.get_memory_summary(user_id)
+            while True:
+                rows = await self.db.get_archived_history_since(
+                    user_id, last_id, MEMORY_FOLD_BATCH
+                ) or await self.db.get_history_since(
+                    user_id, last_id, MEMORY_FOLD_BATCH
+                )
+                if not rows:
+                    break
+
+                new_text = "\n".join(message for _, message, _ in rows if message)
+                if new_text.strip():
+                    if summary:
+                        template = "memory_update"
+                        prompt = format_prompt(
+                            template,
+                            summary=summary,
+                            prompt=new_text,
+                            nickname=nickname,
+                        )
+                    else:
+                        template = "memory_prompt"
+                        prompt = format_prompt(
+                            template, prompt=new_text, nickname=nickname
+                        )
+                    response = await gateway.generate(
+                        prompt, route=template, timeout=MEMORY_FOLD_TIMEOUT
+                    )
+                    summary = response.text.strip()
+
+                last_id = rows[-1][0]
+                await self.db.save_memory_summary(user_id, summary, last_id)
+            return summary
+
+    async def maybe_refresh_memory(
+        self, user_id, nickname: str, min_new_rows: int = MEMORY_REFRESH_EVERY
+    ) -> None:
+        """
+        Starts a background memory refresh once enough new messages have piled up.
+
+        Args:
+            user_id (int): Discord user ID.
+            nickname (str): Display name of the user.
+            min_new_rows (int): Number of unfolded messages that triggers the refresh.
+        """
+        if _user_lock("memory", user_id).locked():
+            return
+        _, last_id = await self.db.get_memory_summary(user_id)
+        if await self.db.count_history_since(user_id, last_id) < min_new_rows:
+            return
+
+        async def refresh():
+            try:
+                await self.refresh_user_memory(user_id, nickname)
+            except Exception as e:
+                logger.error(f"Error refreshing memory in background: {e}")
+
+        _spawn(refresh())
+
     async def get_ai_short_response(self, response: str) -> str:
         """
         Generates a shorter or summarized version of a full AI response.
 
+        Uses the local extractive summariser unless SHORT_RESPONSE_MODE is
+        "llm", in which case the short_response prompt is sent to Gemini.
+
         Args:
-            response (str): Full text response from the AI.
+            response (str): Full text response from the AI (a raw model
+                response object is accepted as well).
 
         Returns:
             str: A concise version of the AI response.
         """
-        prompt = format_prompt("short_response", prompt=response)
-        short_response = await asyncio.wait_for(
-            async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-            timeout=20,
-        )
-        return short_response.text.strip()
+        return await shorten_reply(response)
 
     async def get_promptlab(self, prompt_text: str) -> str:
         """
@@ -158,59 +512,22 @@ class TextAIHandler:
             str: A refined and enriched prompt suitable for AI image generation.
                 If an error occurs, returns a fallback error message.
         """
-        prompt = format_prompt("photolab", prompt=prompt_text)
         try:
-            result = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=20,
+            return await response_cache.generate(
+                "photolab", prompt=prompt_text
             )
-            return result.text.strip()
         except Exception as e:
             logger.error(f"Error generationg prompt lab: {e}")
             return "An error occurred while generating the promptlab."
 
-    async def delete_useless_messages(self, user_id: int) -> list:
-        """
-        Filters and removes messages from a user's history that are considered unimportant.
-
-        Args:
-            user_id (int): Discord user ID.
-
-        Returns:
-            list: A list of indices or identifiers of deleted messages.
-        """
-        text_user = await self.db.fetch_user_messages(user_id)
-        if not text_user:
-            return []
-
-        prompt = format_prompt("useless_message", text_user=text_user)
-
-        try:
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=25,
-            )
-            json_response = json.loads(
-                response.text.strip()[8:-3]
-            )  # assume it returns '```json { ... }```'
-            logger.info(json_response.get("delete", []))
-            return json_response.get("delete", [])
-        except Exception as e:
-            logger.error(f"Error deleting useless messages: {e}")
-            return []
-
     async def get_server_timezone(self) -> str:
         """
-        Asynchronously retrieves the server's current timezone based on its IP address.
-
-        Uses the ip-api.com service to determine geographical location and corresponding timezone.
+        Returns the server's timezone, resolved once per process (see server_timezone).
 
         Returns:
             str: Timezone string in the format "Continent/City" (e.g., "Asia/Baku").
         """
-        response = requests.get("http://ip-api.com/json/")
-        data = response.json()
-        return data.get("timezone", "UTC")
+        return server_timezone()
 
     async def get_current_time_in_timezone(self, timezone_str: str) -> str:
         """
@@ -222,6 +539,5 @@ class TextAIHandler:
         Returns:
             str: Formatted current time as 'YYYY-MM-DD HH:MM:SS'.
         """
-        tz = pytz.timezone(timezone_str)
-        now = datetime.now(tz)
+        now = datetime.now(_tzinfo(timezone_str))
         return now.strftime("%Y-%m-%d %H:%M:%S")
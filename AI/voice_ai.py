@@ -1,13 +1,14 @@
+import os
 import random
 from uuid import uuid4
 import aiohttp
-import asyncio
 import edge_tts
-from prompt import format_prompt
-from AI.ai_config import GEMINI_AI, GROQ
+from AI.response_cache import response_cache
+from AI.ai_config import GROQ
+from AI.gateway import gateway
 from logger_config import logger
-from utils import async_wrap_blocking
 from typing import Optional
+from utils import run_blocking
 
 
 class VoiceAIHandler:
@@ -59,8 +60,11 @@ class VoiceAIHandler:
             file_path (str): Destination file path.
             content (bytes): File content to write.
         """
-        with open(file_path, "wb") as f:
-            f.write(content)
+        def write():
+            with open(file_path, "wb") as f:
+                f.write(content)
+
+        await run_blocking("io", write)
 
     async def transcribe_audio_file(self, file_path: str):
         """
@@ -72,16 +76,27 @@ class VoiceAIHandler:
         Returns:
             Transcription object.
         """
-        with open(file_path, "rb") as audio_file:
+        model = random.choice(self.WHISPER_MODELS)
+
+        def read():
+            with open(file_path, "rb") as audio_file:
+                return audio_file.read()
+
+        audio = await run_blocking("io", read)
+
+        def transcribe():
+            # A fresh request per attempt, so gateway retries resend the whole file.
             return GROQ.audio.transcriptions.create(
-                file=audio_file,
-                model=random.choice(self.WHISPER_MODELS),
+                file=(os.path.basename(file_path), audio),
+                model=model,
                 language="en",
                 prompt="This is English voice.",
                 response_format="json",
                 temperature=0.0,
             )
 
+        return await gateway.call(model, transcribe)
+
     async def detect_voice(self, text: str) -> str:
         """
         Detects appropriate TTS voice model based on input text.
@@ -93,15 +108,10 @@ class VoiceAIHandler:
             str: Detected voice model name.
         """
         try:
-            prompt = format_prompt("detect_voice", prompt=text)
-
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, contents=prompt),
-                timeout=20,
+            return await response_cache.generate(
+                "detect_voice", prompt=text
             )
 
-            return response.text.strip()
-
         except Exception as e:
             logger.error(f"🚨 Error detecting voice: {e}")
             return "en-US-JennyNeural"
@@ -14,3 +14,15 @@ DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
 
 BOT_NAME = os.getenv("BOT_NAME") 
+
+
+# STREAMED REPLIES: edit the reply embed while the model is still writing.
+# Discord allows about 5 edits per 5 seconds per channel, so edits are
+# throttled to one every STREAM_EDIT_INTERVAL seconds.
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+
+
+# RUNTIME STATS: model gateway, response cache, image cache and executor
+# counters are logged every STATS_LOG_INTERVAL seconds and at shutdown.
+STATS_LOG_INTERVAL = int(os.getenv("STATS_LOG_INTERVAL", "3600"))
@@ -3,6 +3,7 @@ from discord.ext import commands
 from discord import app_commands
 from AI.text_ai import TextAIHandler
 from BOT.handler import DiscordResponseHandler
+from utils import run_blocking
 import os
 
 
@@ -35,7 +36,7 @@ class ImagineCommands(commands.Cog):
         if image_path:
             file = discord.File(image_path)
             await interaction.followup.send(content=reply_text, file=file)
-            os.remove(image_path)
+            await run_blocking("io", os.remove, image_path)
         else:
             await interaction.followup.send(content=reply_text)
 
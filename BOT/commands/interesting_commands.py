@@ -5,9 +5,9 @@ from database.db import DatabaseManager
 from BOT.handler import DiscordResponseHandler
 from logger_config import logger
 from prompt import format_prompt
-from utils import async_wrap_blocking
-from AI.ai_config import GEMINI_AI
-import asyncio
+from AI.gateway import gateway
+from AI.post_processor import post_processor
+from AI.response_cache import response_cache
 
 
 class InterestingCommands(commands.Cog):
@@ -55,9 +55,7 @@ class InterestingCommands(commands.Cog):
 
             prompt = format_prompt("quote")
 
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, prompt), timeout=25
-            )
+            response = await gateway.generate(prompt, route="quote")
 
             await self.handler.safe_embed_reply(
                 interaction,
@@ -82,16 +80,16 @@ class InterestingCommands(commands.Cog):
             await interaction.response.defer(thinking=True)
             nickname = interaction.user.display_name
 
-            prompt = format_prompt("explain_code", code=code)
-
-            response = await asyncio.wait_for(
-                async_wrap_blocking(GEMINI_AI.generate_content, prompt), timeout=25
+            explanation = await response_cache.generate(
+                "explain_code", code=code
+            )
+            await post_processor.submit(
+                interaction.user.id, code, explanation, shorten=False
             )
-            await self.db.save_history(interaction.user.id, code, response.text.strip())
 
             await self.handler.safe_embed_reply(
                 interaction,
-                response.text.strip(),
+                explanation,
                 nickname,
                 title="💡 Code Explanation",
             )
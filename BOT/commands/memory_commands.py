@@ -6,6 +6,8 @@ from BOT.handler import DiscordResponseHandler
 import os
 
 from database.db import DatabaseManager
+from database.vector_store import vector_memory
+from utils import run_blocking
 
 
 class MemoryCommands(commands.Cog):
@@ -35,6 +37,34 @@ class MemoryCommands(commands.Cog):
             interaction, summary, nickname, title="🧠 Memory Summary"
         )
 
+    @app_commands.command(
+        name="recall", description="Search your chat history with the AI 🔎"
+    )
+    @app_commands.describe(query="Words to look for in your past conversations.")
+    async def recall(self, interaction: discord.Interaction, query: str):
+        """
+        Finds the past conversation turns that best match the query.
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction object.
+            query (str): Keywords to search for.
+        """
+        await interaction.response.defer()
+        user_id = str(interaction.user.id)
+        nickname = interaction.user.display_name
+
+        matches = await self.db.search_history(user_id, query, limit=5)
+        if not matches:
+            text = "I couldn't find anything about that in our chat history. 🔎"
+        else:
+            text = "\n\n".join(
+                f"**{idx}.** 🗨️ {match['message_snippet']}\n🤖 {match['response_snippet']}"
+                for idx, match in enumerate(matches, start=1)
+            )
+        await self.handler.safe_embed_reply(
+            interaction, text, nickname, title="🔎 Recall"
+        )
+
     @app_commands.command(name="reset", description="Reset all chat history 🧹")
     async def reset(self, interaction: discord.Interaction):
         """
@@ -45,4 +75,5 @@ class MemoryCommands(commands.Cog):
         """
         user_id = str(interaction.user.id)
         await self.db.reset_chat(user_id)
+        await run_blocking("io", vector_memory.drop, user_id)
         await interaction.response.send_message("Chat history has been reset! 🧹")
@@ -9,6 +9,9 @@ from logger_config import logger
 from AI.weather_ai import Weather
 from discord import Interaction, Embed
 from AI.summarize_url_with_ai import SummarizeURL
+from prompt import prompt_registry
+from utils import run_blocking
+from AI.post_processor import post_processor
 
 
 class UtilityCommands(commands.Cog):
@@ -110,14 +113,35 @@ class UtilityCommands(commands.Cog):
             )
             embed.set_footer(text="🔎 Powered by OpenWeather")
 
-            await self.db.save_history(
-                interaction.user.id, city, f"Weather in {city}: {weather_description}"
+            await post_processor.submit(
+                interaction.user.id,
+                city,
+                f"Weather in {city}: {weather_description}",
+                shorten=False,
             )
             await interaction.followup.send(embed=embed)
         else:
             await interaction.followup.send(f"❌ Sorry, no weather found for `{city}`.")
 
 
+    @app_commands.command(
+        name="reload_prompts",
+        description="🛠️ Reload prompt templates from disk (admins only).",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def reload_prompts(self, interaction: Interaction):
+        """Re-reads every prompt template and reports what changed."""
+        try:
+            loaded = await run_blocking("io", prompt_registry.reload, True)
+            await interaction.response.send_message(
+                f"✅ Reloaded {len(loaded)} prompt template(s).", ephemeral=True
+            )
+        except Exception as e:
+            logger.error(f"🚨 Error reloading prompts: {e}")
+            await interaction.response.send_message(
+                f"❌ Prompt reload failed: {e}", ephemeral=True
+            )
+
     @app_commands.command(
         name="help", description="📚 Get a list of available commands."
     )
@@ -138,6 +162,11 @@ class UtilityCommands(commands.Cog):
             value="Summarize what the bot remembers about you",
             inline=False,
         )
+        embed.add_field(
+            name="🔎 `/recall`",
+            value="Search your past conversations with the bot",
+            inline=False,
+        )
         embed.add_field(
             name="🗣️ `/voice`, `/text`, `/image`",
             value="Switch between voice, text, or image mode",
@@ -5,16 +5,22 @@ import requests
 import base64
 import random
 import discord
-from BOT.bot_config import BOT_NAME, DISCORD_BOT_TOKEN
+from BOT.bot_config import (
+    BOT_NAME,
+    DISCORD_BOT_TOKEN,
+    STREAM_EDIT_INTERVAL,
+    STREAM_RESPONSES,
+)
 from AI.voice_ai import VoiceAIHandler
 from AI.image_ai import ImageAIHandler
-from AI.text_ai import TextAIHandler
+from AI.text_ai import TEXT_RESPONSE_FALLBACK, TextAIHandler
+from AI.post_processor import post_processor
 from database.db import DatabaseManager
 from logger_config import logger
 from AI.doc_ai import DocAIHandler
-from utils import async_wrap_blocking
+from utils import async_wrap_blocking, run_blocking
 import asyncio
-from typing import Optional, Union
+from typing import AsyncGenerator, Optional, Union
 
 
 class DiscordResponseHandler:
@@ -94,6 +100,8 @@ class DiscordResponseHandler:
             await message.channel.typing()
             if user_message_type == "image":
                 await self.image_mode(message, user_id, content)
+            elif user_message_type == "text" and STREAM_RESPONSES:
+                await self.stream_text_reply(message, user_id, content)
             else:
                 reply_msg = await self.textai_handler.generate_text_response(
                     content, user_id
@@ -101,7 +109,7 @@ class DiscordResponseHandler:
                 await self.handle_text_or_voice_response(
                     message, reply_msg, user_message_type, channel_id
                 )
-            await self.db.success_response(user_id)
+            await post_processor.submit(user_id, count_response=True)
 
         except Exception as e:
             logger.error(e)
@@ -134,18 +142,13 @@ class DiscordResponseHandler:
                 )
                 await self.image_mode(message, user_id, analyzing_image + content)
             else:
-                analyzing_image = (
-                    await self.imageai_handler.get_analyze_image(image_path, content)
-                    if content
-                    else await self.imageai_handler.get_analyze_image(image_path)
-                )
-                reply_msg = await self.imageai_handler.get_results_analyzing_image(
-                    analyzing_image, user_id, content
+                reply_msg = await self.imageai_handler.reply_to_image(
+                    image_path, user_id, content
                 )
                 await self.handle_text_or_voice_response(
                     message, reply_msg, user_message_type, channel_id
                 )
-            await self.db.success_response(user_id)
+            await post_processor.submit(user_id, count_response=True)
         finally:
             await async_wrap_blocking(os.remove, image_path)
 
@@ -177,6 +180,9 @@ class DiscordResponseHandler:
 
         if user_message_type == "image":
             reply_msg = await self.image_mode(message, user_id, transcript)
+            await post_processor.submit(
+                user_id, transcript, reply_msg, shorten=False, count_response=True
+            )
 
         else:
             reply_msg = await self.textai_handler.generate_text_response(
@@ -185,8 +191,8 @@ class DiscordResponseHandler:
             await self.handle_text_or_voice_response(
                 message, reply_msg, user_message_type, channel_id
             )
-        await self.db.save_history(user_id, transcript, reply_msg)
-        await self.db.success_response(user_id)
+            # generate_text_response has already queued the turn itself.
+            await post_processor.submit(user_id, count_response=True)
 
     async def analyze_document(
         self,
@@ -308,6 +314,102 @@ class DiscordResponseHandler:
                 ]:
                     await send_func(content=text_part)
 
+    async def stream_text_reply(
+        self, message: discord.Message, user_id: str, content: str
+    ) -> None:
+        """
+        Replies to a text message with a streamed Gemini response.
+
+        Args:
+            message (discord.Message): The received Discord message object.
+            user_id (str): ID of the message sender.
+            content (str): Text content of the message.
+        """
+        nickname = message.author.display_name
+        pieces = self.textai_handler.stream_text_response(content, user_id)
+        reply_msg = await self.stream_embed_reply(message, pieces, nickname)
+        if not reply_msg:
+            await self.safe_embed_reply(message, TEXT_RESPONSE_FALLBACK, nickname)
+
+    async def stream_embed_reply(
+        self,
+        message: discord.Message,
+        pieces: AsyncGenerator[str, None],
+        nickname: str,
+        title: str = f"💬 Response - {BOT_NAME}",
+    ) -> str:
+        """
+        Shows a reply while it is being generated: the first piece is posted as
+        an embed right away, which is then edited at most once every
+        STREAM_EDIT_INTERVAL seconds. Text beyond DISCORD_EMBED_LIMIT rolls
+        over into a new embed. If Discord rejects an edit, the rest of the
+        stream is still drained (so the turn is saved) but no longer shown.
+
+        Args:
+            message (discord.Message): Message to reply to.
+            pieces (AsyncGenerator[str, None]): Consecutive pieces of the reply;
+                closed before returning.
+            nickname (str): Display name of the user.
+            title (str): Title of the first embed.
+
+        Returns:
+            str: The text that was shown. If the stream fails, the text shown
+                up to that point (empty if nothing arrived).
+        """
+        loop = asyncio.get_running_loop()
+        color = discord.Color(random.randint(0, 0xFFFFFF))
+        full_text = ""
+        current = None  # embed message currently being edited
+        start = 0  # offset of the current embed's text in full_text
+        shown = 0  # characters of full_text visible so far
+        last_edit = 0.0
+
+        def build_embed(text: str, first: bool) -> discord.Embed:
+            embed = discord.Embed(
+                title=title if first else None, description=text, color=color
+            )
+            if first:
+                embed.set_footer(text=f"Response for {nickname}")
+            return embed
+
+        async def flush() -> None:
+            nonlocal current, start, shown, last_edit
+            while len(full_text) > shown:
+                text = full_text[start : start + self.DISCORD_EMBED_LIMIT]
+                embed = build_embed(text, start == 0)
+                if current is None:
+                    current = await message.reply(embed=embed)
+                else:
+                    await current.edit(embed=embed)
+                shown = start + len(text)
+                if len(text) == self.DISCORD_EMBED_LIMIT:
+                    current, start = None, shown
+            last_edit = loop.time()
+
+        async def safe_flush() -> bool:
+            try:
+                await flush()
+                return True
+            except Exception as e:
+                logger.error(f"🚨 Error showing streamed response: {e}")
+                return False
+
+        visible = True  # False once Discord rejected a reply or an edit
+        try:
+            async for piece in pieces:
+                full_text += piece
+                if visible and (
+                    shown == 0 or loop.time() - last_edit >= STREAM_EDIT_INTERVAL
+                ):
+                    visible = await safe_flush()
+        except Exception as e:
+            logger.error(f"🚨 Error streaming text response: {e}")
+        finally:
+            await pieces.aclose()
+        if visible:
+            await safe_flush()
+        return full_text[:shown]
+
     async def save_image(self, file: discord.Attachment) -> str:
         """
         Saves uploaded image file locally.
@@ -374,7 +476,8 @@ class DiscordResponseHandler:
             ]
         }
 
-        res = await asyncio.to_thread(
+        res = await run_blocking(
+            "io",
             requests.post,
             f"https://discord.com/api/v10/channels/{channel_id}/attachments",
             headers=headers,
@@ -383,10 +486,11 @@ class DiscordResponseHandler:
         res.raise_for_status()
         upload_data = res.json()["attachments"][0]
 
-        with open(ogg_path, "rb") as f:
-            audio_bytes = f.read()
+        async with aiofiles.open(ogg_path, "rb") as f:
+            audio_bytes = await f.read()
 
-        await asyncio.to_thread(
+        await run_blocking(
+            "io",
             requests.put,
             upload_data["upload_url"],
             headers={"Content-Type": "audio/ogg"},
@@ -415,7 +519,8 @@ class DiscordResponseHandler:
                 "channel_id": channel_id,
             }
 
-        await asyncio.to_thread(
+        await run_blocking(
+            "io",
             requests.post,
             f"https://discord.com/api/v10/channels/{channel_id}/messages",
             headers=headers,
@@ -16,9 +16,18 @@ import asyncio
 import os
 from discord.ext import commands
 from database.db import DatabaseManager
-from AI.text_ai import TextAIHandler
+from database.pool import close_all_pools
+from database.retention import HistoryRetention
+from AI.text_ai import TextAIHandler, server_timezone
+from AI.curation import HistoryCurator
+from AI.post_processor import post_processor
+from AI.gateway import gateway
+from AI.response_cache import response_cache
+from AI.image_cache import image_cache
+from prompt import prompt_registry
+from utils import executor_stats, shutdown_executors
 from BOT.handler import DiscordResponseHandler
-from BOT.bot_config import DISCORD_BOT_TOKEN
+from BOT.bot_config import DISCORD_BOT_TOKEN, STATS_LOG_INTERVAL
 from logger_config import logger
 from BOT.reminder import ReminderHandler
 from BOT.commands.image_commands import ImagineCommands
@@ -34,7 +43,17 @@ intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="/", intents=intents)
+
+
+class AIBot(commands.Bot):
+    """Bot that releases the controller's shared resources when it shuts down."""
+
+    async def close(self) -> None:
+        await controller.shutdown()
+        await super().close()
+
+
+bot = AIBot(command_prefix="/", intents=intents)
 
 
 class BotController:
@@ -52,6 +71,8 @@ class BotController:
         self.handler = DiscordResponseHandler()
         self.textai_handler = TextAIHandler()
         self.reminder_handler = ReminderHandler()
+        self.retention = HistoryRetention()
+        self.curator = HistoryCurator()
 
     async def setup(self):
         """Create necessary directories and load bot commands."""
@@ -60,6 +81,10 @@ class BotController:
         os.makedirs("media/out", exist_ok=True)
         os.makedirs("media/audio", exist_ok=True)
         os.makedirs("media/files", exist_ok=True)
+        # Fails fast on a template that uses placeholders its callers never pass.
+        prompt_registry.reload()
+        # Resolved once here so no message ever waits for it.
+        server_timezone()
         for i in [
             ImagineCommands,
             ModeCommands,
@@ -77,12 +102,42 @@ class BotController:
         await self.bot.wait_until_ready()
         await self.bot.tree.sync()
         self.bot.loop.create_task(self.reminder_handler.reminder_loop(self.bot))
+        self.bot.loop.create_task(self.retention.run_forever())
+        self.bot.loop.create_task(self.curator.run_forever())
+        self.bot.loop.create_task(self.log_stats_forever())
+        self.bot.loop.create_task(prompt_registry.watch())
+        post_processor.start()
 
         await self.bot.change_presence(
             activity=discord.Game(name="Chatting with you 👀")
         )
         logger.info(f"{self.bot.user} connected.")
 
+    async def shutdown(self):
+        """Flush queued post-processing, close the shared database connections and stop the worker pools."""
+        await post_processor.close()
+        await close_all_pools()
+        logger.info("Database connections closed.")
+        self.log_stats()
+        shutdown_executors()
+
+    @staticmethod
+    def log_stats() -> None:
+        """Log the model gateway, cache and executor counters."""
+        logger.info(f"Gateway metrics: {gateway.metrics()}")
+        logger.info(f"Response cache stats: {response_cache.stats()}")
+        logger.info(f"Image cache stats: {image_cache.stats()}")
+        logger.info(f"Executor stats: {executor_stats()}")
+
+    async def log_stats_forever(self) -> None:
+        """Background task that logs the runtime counters periodically."""
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            try:
+                self.log_stats()
+            except Exception as e:
+                logger.error(f"Logging runtime stats failed: {e}")
+
     async def on_message(self, message: Message) -> None:
         """Main message handler for processing text, and voice content."""
         await self.bot.process_commands(message)
@@ -90,25 +145,17 @@ class BotController:
             return
 
         user_id = str(message.author.id)
-        if await self.db.get_message_type(user_id) is None:
-            await self.db.set_message_type(user_id, "text")
-        if await self.db.get_mode(user_id) is None:
-            await self.db.set_mode(user_id, 1)
-        user_message_type = await self.db.get_message_type(user_id)
-
         nickname = str(message.author.display_name)
         content = message.content.strip()
         channel_id = str(message.channel.id)
-        await self.db.update_user_info(user_id, nickname)
-        chat_mode = await self.db.get_mode(user_id)
+
+        user_state = await self.db.ensure_user(user_id, nickname)
+        user_message_type = user_state["message_type"]
+        chat_mode = user_state["mode"]
         logger.info(chat_mode)
         if not chat_mode:
             return
 
-        if await self.db.get_response_count(user_id) % 10 == 0:
-            response = await self.textai_handler.delete_useless_messages(user_id)
-            await self.db.delete_by_id(response)
-
         if message.attachments:
             await message.channel.typing()
             file = message.attachments[0]
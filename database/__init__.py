@@ -1 +1,4 @@
 from .db import *
+from .pool import *
+from .retention import *
+from .vector_store import VectorMemory, vector_memory
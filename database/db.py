@@ -1,4 +1,258 @@
-import aiosqlite
+import json
+import re
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .pool import get_pool
+
+USER_STATE_FIELDS = ("nickname", "message_type", "mode", "response_count")
+
+
+class UserSettingsCache:
+    """
+    In-memory, write-through cache of `user_state` rows (nickname, message
+    type, mode and response count), one dict per user.
+
+    Entries are evicted in least-recently-used order once `max_size` users are
+    cached, and expire `ttl` seconds after they were loaded so that rows edited
+    outside of the bot are eventually picked up again.
+    """
+
+    def __init__(self, max_size=10000, ttl=600):
+        """
+        :param max_size: Maximum number of users kept in the cache.
+        :param ttl: Lifetime of a cached user entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        """
+        Return the cached state of a user, dropping it if it has expired.
+
+        :param user_id: ID of the user.
+        :return: The state dict (do not mutate it) or None if not cached.
+        """
+        key = str(user_id)
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def put(self, user_id, state):
+        """
+        Cache the full state of a user after it has been read from the database.
+
+        :param user_id: ID of the user.
+        :param state: Dict with every key of `USER_STATE_FIELDS`.
+        """
+        key = str(user_id)
+        self._entries[key] = (time.monotonic() + self.ttl, dict(state))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def update(self, user_id, **fields):
+        """
+        Apply a write to the cached state of a user, if it is cached.
+
+        :param user_id: ID of the user.
+        :param fields: Changed settings.
+        """
+        state = self.get(user_id)
+        if state is not None:
+            state.update(fields)
+
+    def invalidate(self, user_id):
+        """
+        Drop the cached state of a user.
+
+        :param user_id: ID of the user.
+        """
+        self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        """
+        Remove every cached entry.
+        """
+        self._entries.clear()
+
+
+# Schema migrations, applied in order on startup. The database's
+# `PRAGMA user_version` records how many of them have already run.
+MIGRATIONS = [
+    # 1: serve per-user history lookups from an index instead of a table scan.
+    [
+        "CREATE INDEX IF NOT EXISTS idx_history_user_id ON history (user_id, id)",
+    ],
+    # 2: rolling per-user memory summary with the last folded history id.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS memory_summary (
+            user_id TEXT PRIMARY KEY,
+            summary TEXT,
+            last_history_id INTEGER DEFAULT 0
+        )
+        """,
+    ],
+    # 3: FTS5 index over history, kept in sync by triggers.
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            user_id, message, response,
+            content = 'history', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, user_id, message, response)
+            VALUES (new.id, new.user_id, new.message, new.response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, message, response)
+            VALUES ('delete', old.id, old.user_id, old.message, old.response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE ON history BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, message, response)
+            VALUES ('delete', old.id, old.user_id, old.message, old.response);
+            INSERT INTO history_fts (rowid, user_id, message, response)
+            VALUES (new.id, new.user_id, new.message, new.response);
+        END
+        """,
+        "INSERT INTO history_fts (history_fts) VALUES ('rebuild')",
+    ],
+    # 4: merge users, messages_type, response_count and user_mode into one
+    # user_state row per user. The legacy tables are created first so the
+    # migration also runs on a fresh database.
+    [
+        "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, nickname TEXT)",
+        "CREATE TABLE IF NOT EXISTS messages_type (user_id TEXT PRIMARY KEY, type TEXT)",
+        "CREATE TABLE IF NOT EXISTS response_count (user_id TEXT PRIMARY KEY, response_count INTEGER DEFAULT 1)",
+        "CREATE TABLE IF NOT EXISTS user_mode (user_id TEXT PRIMARY KEY, mode INTEGER)",
+        """
+        CREATE TABLE IF NOT EXISTS user_state (
+            user_id TEXT PRIMARY KEY,
+            nickname TEXT,
+            message_type TEXT,
+            mode INTEGER,
+            response_count INTEGER
+        )
+        """,
+        """
+        INSERT OR REPLACE INTO user_state (user_id, nickname, message_type, mode, response_count)
+        SELECT ids.user_id, u.nickname, t.type, m.mode, c.response_count
+        FROM (
+            SELECT user_id FROM users
+            UNION SELECT user_id FROM messages_type
+            UNION SELECT user_id FROM response_count
+            UNION SELECT user_id FROM user_mode
+        ) AS ids
+        LEFT JOIN users u ON u.user_id = ids.user_id
+        LEFT JOIN messages_type t ON t.user_id = ids.user_id
+        LEFT JOIN response_count c ON c.user_id = ids.user_id
+        LEFT JOIN user_mode m ON m.user_id = ids.user_id
+        """,
+        "DROP TABLE users",
+        "DROP TABLE messages_type",
+        "DROP TABLE response_count",
+        "DROP TABLE user_mode",
+    ],
+    # 5: history timestamps, compressed cold archive and incremental vacuum.
+    # Rows saved before this migration keep a NULL created_at.
+    [
+        "ALTER TABLE history ADD COLUMN created_at INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS history_archive (
+            user_id TEXT,
+            month TEXT,
+            first_id INTEGER,
+            last_id INTEGER,
+            row_count INTEGER,
+            data BLOB,
+            PRIMARY KEY (user_id, first_id)
+        )
+        """,
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        "VACUUM",
+    ],
+    # 6: second tier of the LLM response cache (see AI/response_cache.py).
+    [
+        """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            template TEXT,
+            response TEXT,
+            expires_at INTEGER
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)",
+    ],
+    # 7: per-user progress of the background history curation.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS history_curation (
+            user_id TEXT PRIMARY KEY,
+            last_history_id INTEGER DEFAULT 0
+        )
+        """,
+    ],
+    # 8: second tier of the image analysis cache (see AI/image_cache.py).
+    [
+        """
+        CREATE TABLE IF NOT EXISTS image_analysis_cache (
+            key TEXT PRIMARY KEY,
+            prompt_key TEXT,
+            dhash TEXT,
+            analysis TEXT,
+            used_at INTEGER
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_image_analysis_used ON image_analysis_cache (used_at)",
+    ],
+    # 9: image dimensions, which confirm a near-duplicate match of the dHash.
+    [
+        "ALTER TABLE image_analysis_cache ADD COLUMN width INTEGER",
+        "ALTER TABLE image_analysis_cache ADD COLUMN height INTEGER",
+    ],
+]
+
+# Longest keyword list sent to FTS5 for a single search.
+FTS_MAX_TERMS = 12
+
+# Bound parameters per statement for `IN (...)` lists, kept well below
+# SQLite's SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+SQL_MAX_PARAMS = 500
+
+
+def _chunks(items, size=SQL_MAX_PARAMS):
+    """
+    Split a sequence into lists of at most `size` items.
+
+    :param items: Sequence to split.
+    :param size: Maximum chunk length.
+    :return: Generator of lists.
+    """
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+# Shared by every DatabaseManager instance so that writes made through one
+# manager (e.g. a slash command cog) are visible to all the others.
+user_settings_cache = UserSettingsCache()
+
 
 class DatabaseManager:
     """
@@ -6,7 +260,9 @@ class DatabaseManager:
     chat history, message types, and user interaction modes.
 
     This class provides high-level functions to interact with the database
-    using `aiosqlite` to ensure non-blocking I/O operations.
+    using `aiosqlite` to ensure non-blocking I/O operations. All instances for
+    the same file share one connection pool (see `database.pool`), so creating
+    a manager is cheap and never opens extra connections.
     """
 
     def __init__(self, db_path="database.db"):
@@ -16,39 +272,98 @@ class DatabaseManager:
         :param db_path: Path to the SQLite database file.
         """
         self.db_path = db_path
-        self.db = None
-        self._initialized = False
+        self.pool = get_pool(db_path)
+        self.cache = user_settings_cache
+
+    @property
+    def db(self):
+        """
+        The shared writer connection.
+        """
+        return self.pool.writer
 
     async def _ensure_connection(self):
         """
-        Ensure that a connection to the database is established and the schema is initialized.
+        Ensure that the shared pool is open and the schema is initialized.
         This method is called before any database operation to guarantee readiness.
         """
-        if not self._initialized:
-            self.db = await aiosqlite.connect(self.db_path)
-            await self.db.execute("PRAGMA foreign_keys = ON;")
-            await self._setup_db()
-            self._initialized = True
+        if not self.pool.is_open:
+            await self.pool.open(self._setup_db)
 
     async def close(self):
         """
-        Close the active database connection, if any.
+        Close the shared connection pool. Other managers for the same file will
+        reopen it on their next query.
+        """
+        await self.pool.close()
+
+    async def _execute_write(self, query, params=(), many=False):
+        """
+        Run a write statement through the pool's writer (see `ConnectionPool.execute_write`).
+
+        :param query: SQL statement.
+        :param params: Statement parameters.
+        :param many: Use `executemany` with a sequence of parameter tuples.
+        """
+        await self._ensure_connection()
+        await self.pool.execute_write(query, params, many=many)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Group several writes (e.g. everything one chat message changes) into a
+        single commit. Writes made through any DatabaseManager inside the block
+        join the transaction; on error it is rolled back and the settings cache
+        is cleared, since it may hold values that were never committed.
+
+        Usage:
+            async with db.transaction():
+                await db.set_mode(user_id, 1)
+                await db.update_user_info(user_id, nickname)
+        """
+        await self._ensure_connection()
+        try:
+            async with self.pool.transaction():
+                yield self
+        except BaseException:
+            self.cache.clear()
+            raise
+
+    async def _fetchone(self, query, params=()):
+        """
+        Run a read query on a pooled reader connection and return the first row.
+
+        :param query: SQL query.
+        :param params: Query parameters.
+        :return: The first row or None.
+        """
+        await self._ensure_connection()
+        async with self.pool.reader() as conn:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+    async def _fetchall(self, query, params=()):
         """
-        if self.db:
-            await self.db.close()
+        Run a read query on a pooled reader connection and return all rows.
 
-    async def _setup_db(self):
+        :param query: SQL query.
+        :param params: Query parameters.
+        :return: List of rows.
+        """
+        await self._ensure_connection()
+        async with self.pool.reader() as conn:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
+    async def _setup_db(self, db):
         """
         Create required tables if they do not exist.
-        This method is called internally during initialization.
+        This method is called internally by the pool, with its writer connection,
+        during initialization.
+
+        :param db: The writer connection.
         """
         queries = [
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                nickname TEXT
-            )
-            """,
             """
             CREATE TABLE IF NOT EXISTS history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,28 +372,25 @@ class DatabaseManager:
                 response TEXT
             )
             """,
-            """
-            CREATE TABLE IF NOT EXISTS messages_type (
-                user_id TEXT PRIMARY KEY,
-                type TEXT
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS response_count (
-                user_id TEXT PRIMARY KEY,
-                response_count INTEGER DEFAULT 1
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_mode (
-                user_id TEXT PRIMARY KEY,
-                mode INTEGER
-            )
-            """
         ]
         for query in queries:
-            await self.db.execute(query)
-        await self.db.commit()
+            await db.execute(query)
+        await db.commit()
+        await self._migrate(db)
+
+    async def _migrate(self, db):
+        """
+        Apply pending entries of `MIGRATIONS`, one transaction per migration.
+
+        :param db: The writer connection.
+        """
+        async with db.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {number}")
+            await db.commit()
 
     async def setup_db(self):
         """
@@ -86,19 +398,98 @@ class DatabaseManager:
         """
         await self._ensure_connection()
 
+    async def get_user_state(self, user_id):
+        """
+        Retrieve all per-user settings with a single query (or from the cache).
+
+        :param user_id: ID of the user.
+        :return: Dict with keys 'nickname', 'message_type', 'mode' and
+                 'response_count'; values are None when not set.
+        """
+        state = self.cache.get(user_id)
+        if state is not None:
+            return state
+        result = await self._fetchone(
+            "SELECT nickname, message_type, mode, response_count FROM user_state WHERE user_id = ?",
+            (str(user_id),),
+        )
+        state = dict(zip(USER_STATE_FIELDS, result or (None,) * len(USER_STATE_FIELDS)))
+        self.cache.put(user_id, state)
+        return state
+
+    async def ensure_user(self, user_id, nickname, message_type="text", mode=1):
+        """
+        Make sure a user has a state row with default settings and an up-to-date
+        nickname. Costs at most one UPSERT, and none when the cached state is current.
+
+        :param user_id: ID of the user.
+        :param nickname: Current nickname of the user.
+        :param message_type: Message type to set if none is stored.
+        :param mode: Mode to set if none is stored.
+        :return: The user's state dict (see `get_user_state`).
+        """
+        state = await self.get_user_state(user_id)
+        if (
+            state["nickname"] == nickname
+            and state["message_type"] is not None
+            and state["mode"] is not None
+        ):
+            return state
+        await self._execute_write("""
+            INSERT INTO user_state (user_id, nickname, message_type, mode)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                nickname = excluded.nickname,
+                message_type = COALESCE(message_type, excluded.message_type),
+                mode = COALESCE(mode, excluded.mode)
+        """, (str(user_id), nickname, message_type, mode))
+        self.cache.update(
+            user_id,
+            nickname=nickname,
+            message_type=state["message_type"] if state["message_type"] is not None else message_type,
+            mode=state["mode"] if state["mode"] is not None else mode,
+        )
+        return await self.get_user_state(user_id)
+
+    async def touch_user(self, user_id, nickname=None, responded=False):
+        """
+        Set the nickname and/or increment the response count in one UPSERT.
+
+        :param user_id: ID of the user.
+        :param nickname: New nickname, or None to keep the stored one.
+        :param responded: Increment the response count.
+        """
+        await self._execute_write("""
+            INSERT INTO user_state (user_id, nickname, response_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                nickname = COALESCE(excluded.nickname, nickname),
+                response_count = CASE
+                    WHEN excluded.response_count IS NULL THEN response_count
+                    ELSE COALESCE(response_count, 0) + 1
+                END
+        """, (str(user_id), nickname, 1 if responded else None))
+        state = self.cache.get(user_id)
+        if state is not None:
+            fields = {}
+            if nickname is not None:
+                fields["nickname"] = nickname
+            if responded:
+                fields["response_count"] = (state["response_count"] or 0) + 1
+            self.cache.update(user_id, **fields)
+
     async def update_user_info(self, user_id, nickname):
         """
         Insert or update user nickname.
+        The write is skipped when the cached nickname is already up to date.
 
         :param user_id: Unique ID of the user.
         :param nickname: Nickname to associate with the user.
         """
-        await self._ensure_connection()
-        await self.db.execute("""
-            INSERT OR REPLACE INTO users (user_id, nickname)
-            VALUES (?, ?)
-        """, (user_id, nickname))
-        await self.db.commit()
+        state = self.cache.get(user_id)
+        if state is not None and state["nickname"] == nickname:
+            return
+        await self.touch_user(user_id, nickname=nickname)
 
     async def get_user_nick(self, user_id):
         """
@@ -107,10 +498,71 @@ class DatabaseManager:
         :param user_id: User ID to look up.
         :return: Nickname as a string, or None if not found.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT nickname FROM users WHERE user_id = ?", (user_id,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else None
+        return (await self.get_user_state(user_id))["nickname"]
+
+    async def set_message_type(self, user_id, msg_type):
+        """
+        Set the type of message (e.g., text, image) for a user.
+
+        :param user_id: ID of the user.
+        :param msg_type: Type of the message.
+        """
+        await self._execute_write("""
+            INSERT INTO user_state (user_id, message_type)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET message_type = excluded.message_type
+        """, (str(user_id), msg_type))
+        self.cache.update(user_id, message_type=msg_type)
+
+    async def get_message_type(self, user_id):
+        """
+        Retrieve the stored message type for a user.
+
+        :param user_id: ID of the user.
+        :return: The message type as a string or None if not found.
+        """
+        return (await self.get_user_state(user_id))["message_type"]
+
+    async def success_response(self, user_id):
+        """
+        Increment the response count for a user. If the user does not exist, create a new entry with count 1.
+
+        :param user_id: ID of the user.
+        """
+        await self.touch_user(user_id, responded=True)
+
+    async def get_response_count(self, user_id):
+        """
+        Get the total number of responses sent to a user.
+
+        :param user_id: ID of the user.
+        :return: Number of responses sent, or 1 if not found.
+        """
+        count = (await self.get_user_state(user_id))["response_count"]
+        return count if count is not None else 1
+
+    async def set_mode(self, user_id, mode):
+        """
+        Set a user-specific interaction mode (e.g., silent, verbose, voice mode).
+
+        :param user_id: ID of the user.
+        :param mode: Integer representing the mode.
+        """
+        await self._execute_write("""
+            INSERT INTO user_state (user_id, mode)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET mode = excluded.mode
+        """, (str(user_id), mode))
+        self.cache.update(user_id, mode=mode)
+
+    async def get_mode(self, user_id):
+        """
+        Retrieve the interaction mode set for a specific user.
+
+        :param user_id: ID of the user.
+        :return: Integer representing the mode or None if not set.
+        """
+        return (await self.get_user_state(user_id))["mode"]
 
     async def save_history(self, user_id, message, response):
         """
@@ -120,27 +572,117 @@ class DatabaseManager:
         :param message: The original user message.
         :param response: The bot's response to the message.
         """
-        await self._ensure_connection()
-        await self.db.execute("""
-            INSERT INTO history (user_id, message, response)
-            VALUES (?, ?, ?)
+        await self._execute_write("""
+            INSERT INTO history (user_id, message, response, created_at)
+            VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
         """, (user_id, message, response))
-        await self.db.commit()
 
     async def get_recent_history(self, user_id, limit=None):
         """
         Get the most recent message-response pairs for a user.
 
         :param user_id: The user ID whose history is requested.
-        :param limit: Optional limit on the number of entries returned.
-        :return: List of (message, response) tuples.
+        :param limit: Optional limit on the number of (newest) entries returned.
+        :return: List of (message, response) tuples, oldest first.
         """
-        await self._ensure_connection()
-        query = "SELECT message, response FROM history WHERE user_id = ? ORDER BY id ASC"
-        if limit is not None:
-            query += f" LIMIT {limit}"
-        async with self.db.execute(query, (user_id,)) as cursor:
-            return await cursor.fetchall()
+        return await self._fetchall("""
+            SELECT message, response FROM (
+                SELECT id, message, response FROM history
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ) ORDER BY id ASC
+        """, (user_id, -1 if limit is None else limit))
+
+    async def get_history_window(self, user_id, max_chars, max_turns=None, page_size=20):
+        """
+        Get as many of the newest message-response pairs as fit in a character budget.
+
+        Rows are read newest-first in pages of `page_size` using the
+        `(user_id, id)` index, and reading stops as soon as the budget is spent,
+        so the cost depends on the window size and not on the length of the history.
+
+        :param user_id: The user ID whose history is requested.
+        :param max_chars: Maximum combined length of messages and responses.
+        :param max_turns: Optional maximum number of pairs.
+        :param page_size: Number of rows fetched per query.
+        :return: List of (id, message, response) tuples, oldest first.
+        """
+        window = []
+        used = 0
+        before_id = None
+        while max_turns is None or len(window) < max_turns:
+            if before_id is None:
+                rows = await self._fetchall("""
+                    SELECT id, message, response FROM history
+                    WHERE user_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                """, (user_id, page_size))
+            else:
+                rows = await self._fetchall("""
+                    SELECT id, message, response FROM history
+                    WHERE user_id = ? AND id < ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                """, (user_id, before_id, page_size))
+            for row in rows:
+                used += len(row[1] or "") + len(row[2] or "")
+                if used > max_chars or (max_turns is not None and len(window) >= max_turns):
+                    return window[::-1]
+                window.append(row)
+            if len(rows) < page_size:
+                break
+            before_id = rows[-1][0]
+        return window[::-1]
+
+    async def save_history_many(self, rows):
+        """
+        Save several message-response pairs with one `executemany` and one commit.
+
+        :param rows: Iterable of (user_id, message, response) tuples.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        await self._execute_write("""
+            INSERT INTO history (user_id, message, response, created_at)
+            VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+        """, rows, many=True)
+
+    async def iter_history_pages(self, user_id, page_size=500):
+        """
+        Stream a user's history oldest first, one page at a time.
+
+        Pages are read with keyset pagination on the `(user_id, id)` index, and
+        the reader connection is returned to the pool between pages, so a long
+        export never holds a connection or the whole history in memory.
+
+        :param user_id: ID of the user.
+        :param page_size: Number of rows per page.
+        :return: Async generator of lists of (id, message, response) tuples.
+        """
+        after_id = 0
+        while True:
+            rows = await self.get_history_since(user_id, after_id, page_size)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+
+    async def iter_history(self, user_id, page_size=500):
+        """
+        Stream a user's history oldest first, one row at a time.
+
+        :param user_id: ID of the user.
+        :param page_size: Number of rows fetched per query.
+        :return: Async generator of (id, message, response) tuples.
+        """
+        async for page in self.iter_history_pages(user_id, page_size):
+            for row in page:
+                yield row
 
     async def get_user_full_history(self, user_id):
         """
@@ -149,10 +691,136 @@ class DatabaseManager:
         :param user_id: ID of the user.
         :return: A single string combining all messages separated by newlines.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT message FROM history WHERE user_id = ?", (user_id,)) as cursor:
-            rows = await cursor.fetchall()
-            return "\n".join(row[0] for row in rows)
+        return "\n".join(
+            [message async for _, message, _ in self.iter_history(user_id) if message]
+        )
+
+    @staticmethod
+    def _fts_query(user_id, text):
+        """
+        Build a safe FTS5 MATCH expression: the user's own rows, matching any of
+        the keywords of `text`. Every keyword is quoted, so FTS5 operators typed
+        by users are treated as plain words.
+
+        :param user_id: ID of the user.
+        :param text: Free text to search for.
+        :return: MATCH expression, or None if `text` has no usable keywords.
+        """
+        terms = []
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) > 1 and word not in terms:
+                terms.append(word)
+        if not terms:
+            return None
+        keywords = " OR ".join(f'"{term}"' for term in terms[:FTS_MAX_TERMS])
+        return f'user_id : "{user_id}" AND ({keywords})'
+
+    async def search_history(self, user_id, text, limit=5):
+        """
+        Full-text search over a user's history, best matches first.
+
+        :param user_id: ID of the user.
+        :param text: Free text to search for.
+        :param limit: Maximum number of results.
+        :return: List of dictionaries with keys: 'id', 'message', 'response',
+                 'message_snippet', 'response_snippet'.
+        """
+        match = self._fts_query(user_id, text)
+        if match is None:
+            return []
+        rows = await self._fetchall("""
+            SELECT h.id, h.message, h.response,
+                   snippet(history_fts, 1, '**', '**', '…', 16),
+                   snippet(history_fts, 2, '**', '**', '…', 16)
+            FROM history_fts
+            JOIN history h ON h.id = history_fts.rowid
+            WHERE history_fts MATCH ?
+            ORDER BY bm25(history_fts)
+            LIMIT ?
+        """, (match, limit))
+        return [
+            {
+                "id": row[0],
+                "message": row[1],
+                "response": row[2],
+                "message_snippet": row[3],
+                "response_snippet": row[4],
+            }
+            for row in rows
+        ]
+
+    async def get_history_since(self, user_id, after_id, limit=None):
+        """
+        Retrieve message-response pairs newer than a given history ID, oldest first.
+
+        :param user_id: ID of the user.
+        :param after_id: Only rows with an ID greater than this are returned.
+        :param limit: Optional maximum number of rows.
+        :return: List of (id, message, response) tuples.
+        """
+        return await self._fetchall("""
+            SELECT id, message, response FROM history
+            WHERE user_id = ? AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+        """, (user_id, after_id, -1 if limit is None else limit))
+
+    async def get_history_by_ids(self, ids):
+        """
+        Retrieve specific history rows.
+
+        :param ids: History IDs to look up; IDs that no longer exist are skipped.
+        :return: List of (id, message, response) tuples ordered by ID.
+        """
+        rows = []
+        for chunk in _chunks(ids):
+            placeholders = ", ".join("?" for _ in chunk)
+            rows.extend(await self._fetchall(
+                f"SELECT id, message, response FROM history WHERE id IN ({placeholders})",
+                chunk,
+            ))
+        return sorted(rows)
+
+    async def count_history_since(self, user_id, after_id):
+        """
+        Count history rows newer than a given history ID.
+
+        :param user_id: ID of the user.
+        :param after_id: Only rows with an ID greater than this are counted.
+        :return: Number of rows.
+        """
+        result = await self._fetchone(
+            "SELECT COUNT(*) FROM history WHERE user_id = ? AND id > ?", (user_id, after_id)
+        )
+        return result[0]
+
+    async def get_memory_summary(self, user_id):
+        """
+        Retrieve the stored memory summary of a user.
+
+        :param user_id: ID of the user.
+        :return: Tuple (summary or None, ID of the last history row folded into it).
+        """
+        result = await self._fetchone(
+            "SELECT summary, last_history_id FROM memory_summary WHERE user_id = ?", (user_id,)
+        )
+        return (result[0], result[1]) if result else (None, 0)
+
+    async def save_memory_summary(self, user_id, summary, last_history_id):
+        """
+        Store the memory summary of a user together with its high-water mark.
+
+        :param user_id: ID of the user.
+        :param summary: Summary text.
+        :param last_history_id: ID of the newest history row included in the summary.
+        """
+        await self._execute_write("""
+            INSERT INTO memory_summary (user_id, summary, last_history_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                summary = excluded.summary,
+                last_history_id = excluded.last_history_id
+        """, (user_id, summary, last_history_id))
 
     async def get_history_with_id(self, user_id):
         """
@@ -161,125 +829,325 @@ class DatabaseManager:
         :param user_id: ID of the user.
         :return: List of dictionaries with keys: 'id', 'message', 'response'.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT id, message, response FROM history WHERE user_id = ?", (user_id,)) as cursor:
-            return [{"id": row[0], "message": row[1], "response": row[2]} for row in await cursor.fetchall()]
+        return [
+            {"id": row[0], "message": row[1], "response": row[2]}
+            async for row in self.iter_history(user_id)
+        ]
 
     async def reset_chat(self, user_id):
         """
-        Delete all history entries for a given user.
+        Delete all history entries, the memory summary and the curation
+        progress of a given user.
 
         :param user_id: ID of the user whose history should be deleted.
         """
-        await self._ensure_connection()
-        await self.db.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
-        await self.db.commit()
+        async with self.transaction():
+            await self._execute_write("DELETE FROM history WHERE user_id = ?", (user_id,))
+            await self._execute_write("DELETE FROM memory_summary WHERE user_id = ?", (user_id,))
+            await self._execute_write("DELETE FROM history_curation WHERE user_id = ?", (user_id,))
 
-    async def set_message_type(self, user_id, msg_type):
+    async def delete_by_id(self, ids):
         """
-        Set the type of message (e.g., text, image) for a user.
+        Delete specific history entries by their ID, using set-based
+        `DELETE ... WHERE id IN (...)` statements in one transaction.
 
-        :param user_id: ID of the user.
-        :param msg_type: Type of the message.
+        :param ids: List of message IDs to delete.
         """
-        await self._ensure_connection()
-        await self.db.execute("""
-            INSERT INTO messages_type (user_id, type)
-            VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET type = excluded.type
-        """, (user_id, msg_type))
-        await self.db.commit()
+        chunks = list(_chunks(ids))
+        if not chunks:
+            return
+        async with self.transaction():
+            for chunk in chunks:
+                placeholders = ", ".join("?" for _ in chunk)
+                await self._execute_write(
+                    f"DELETE FROM history WHERE id IN ({placeholders})", chunk
+                )
 
-    async def get_message_type(self, user_id):
+    async def get_retention_candidates(self, max_rows, created_before):
         """
-        Retrieve the stored message type for a user.
+        Find users whose hot history exceeds the row cap or contains rows older
+        than the age cutoff.
 
-        :param user_id: ID of the user.
-        :return: The message type as a string or None if not found.
+        :param max_rows: Per-user row cap (0 disables it).
+        :param created_before: Unix timestamp cutoff (None disables it).
+        :return: List of user IDs.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT type FROM messages_type WHERE user_id = ?", (user_id,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else None
+        users = set()
+        if max_rows:
+            rows = await self._fetchall(
+                "SELECT user_id FROM history GROUP BY user_id HAVING COUNT(*) > ?",
+                (max_rows,),
+            )
+            users.update(row[0] for row in rows)
+        if created_before is not None:
+            rows = await self._fetchall(
+                "SELECT DISTINCT user_id FROM history WHERE created_at < ?",
+                (created_before,),
+            )
+            users.update(row[0] for row in rows)
+        return sorted(users)
 
-    async def success_response(self, user_id):
+    async def archive_history(self, user_id, max_rows, created_before):
         """
-        Increment the response count for a user. If the user does not exist, create a new entry with count 1.
+        Move a user's rows past the row cap or older than the cutoff from
+        `history` into `history_archive`, as one zlib-compressed JSON chunk per
+        month, in a single transaction.
 
         :param user_id: ID of the user.
+        :param max_rows: Number of newest rows to keep (0 disables the cap).
+        :param created_before: Unix timestamp cutoff (None disables it).
+        :return: Number of archived rows.
         """
-        await self._ensure_connection()
-        await self.db.execute("""
-            INSERT INTO response_count (user_id, response_count)
-            VALUES (?, 1)
-            ON CONFLICT(user_id) DO UPDATE SET response_count = response_count + 1
-        """, (user_id,))
-        await self.db.commit()
+        async with self.transaction():
+            rows = []
+            if max_rows:
+                async with self.db.execute("""
+                    SELECT id, message, response, created_at FROM history
+                    WHERE user_id = ?
+                    ORDER BY id DESC
+                    LIMIT -1 OFFSET ?
+                """, (user_id, max_rows)) as cursor:
+                    rows.extend(await cursor.fetchall())
+            if created_before is not None:
+                async with self.db.execute("""
+                    SELECT id, message, response, created_at FROM history
+                    WHERE user_id = ? AND created_at < ?
+                """, (user_id, created_before)) as cursor:
+                    rows.extend(await cursor.fetchall())
+            rows = sorted({row[0]: row for row in rows}.values())
+            if not rows:
+                return 0
 
-    async def get_response_count(self, user_id):
+            chunks = {}
+            for row in rows:
+                month = time.strftime("%Y-%m", time.gmtime(row[3])) if row[3] else "legacy"
+                chunks.setdefault(month, []).append(list(row))
+            await self.db.executemany("""
+                INSERT INTO history_archive (user_id, month, first_id, last_id, row_count, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                (
+                    user_id,
+                    month,
+                    chunk[0][0],
+                    chunk[-1][0],
+                    len(chunk),
+                    zlib.compress(json.dumps(chunk, ensure_ascii=False).encode("utf-8")),
+                )
+                for month, chunk in chunks.items()
+            ])
+            await self.delete_by_id([row[0] for row in rows])
+        return len(rows)
+
+    async def get_archived_history_since(self, user_id, after_id, limit=None):
         """
-        Get the total number of responses sent to a user.
+        Read archived message-response pairs newer than a given history ID, oldest first.
 
         :param user_id: ID of the user.
-        :return: Number of responses sent, or 1 if not found.
+        :param after_id: Only rows with an ID greater than this are returned.
+        :param limit: Optional maximum number of rows.
+        :return: List of (id, message, response) tuples.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT response_count FROM response_count WHERE user_id = ?", (user_id,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else 1
+        chunks = await self._fetchall("""
+            SELECT data FROM history_archive
+            WHERE user_id = ? AND last_id > ?
+            ORDER BY first_id
+        """, (user_id, after_id))
+        rows = []
+        for (data,) in chunks:
+            for history_id, message, response, _ in json.loads(zlib.decompress(data)):
+                if history_id > after_id:
+                    rows.append((history_id, message, response))
+                    if limit is not None and len(rows) >= limit:
+                        return rows
+        return rows
 
-    async def delete_by_id(self, ids):
+    async def get_cached_response(self, key):
         """
-        Delete specific history entries by their ID.
+        Look up an unexpired entry of the LLM response cache.
 
-        :param ids: List of message IDs to delete.
+        :param key: Cache key.
+        :return: (response, expires_at) tuple, or None on a miss.
+        """
+        return await self._fetchone(
+            "SELECT response, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+            (key, int(time.time())),
+        )
+
+    async def save_cached_response(self, key, template, response, expires_at):
+        """
+        Store (or replace) an entry of the LLM response cache.
+
+        :param key: Cache key.
+        :param template: Name of the prompt template that produced the response.
+        :param response: Response text.
+        :param expires_at: Unix time after which the entry is stale.
+        """
+        await self._execute_write(
+            "INSERT OR REPLACE INTO response_cache (key, template, response, expires_at) VALUES (?, ?, ?, ?)",
+            (key, template, response, int(expires_at)),
+        )
+
+    async def prune_response_cache(self, max_rows):
+        """
+        Delete expired cache entries, then the entries closest to expiry until
+        at most `max_rows` remain.
+
+        :param max_rows: Maximum number of entries to keep.
+        """
+        async with self.transaction():
+            await self._execute_write(
+                "DELETE FROM response_cache WHERE expires_at <= ?", (int(time.time()),)
+            )
+            await self._execute_write("""
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache
+                    ORDER BY expires_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (max_rows,))
+
+    async def get_image_analysis(self, key):
+        """
+        Look up an entry of the image analysis cache and mark it as used.
+
+        :param key: Cache key (hash of the image bytes and the analysis prompt).
+        :return: The cached analysis text, or None on a miss.
+        """
+        row = await self._fetchone(
+            "SELECT analysis FROM image_analysis_cache WHERE key = ?", (key,)
+        )
+        if row is None:
+            return None
+        await self._execute_write(
+            "UPDATE image_analysis_cache SET used_at = ? WHERE key = ?",
+            (int(time.time()), key),
+        )
+        return row[0]
+
+    async def get_recent_image_analyses(self, limit):
+        """
+        Retrieve the most recently used entries of the image analysis cache.
+
+        :param limit: Maximum number of entries.
+        :return: List of (key, prompt_key, dhash, width, height, analysis) tuples,
+            most recent first.
+        """
+        return await self._fetchall("""
+            SELECT key, prompt_key, dhash, width, height, analysis
+            FROM image_analysis_cache
+            ORDER BY used_at DESC
+            LIMIT ?
+        """, (limit,))
+
+    async def save_image_analysis(self, key, prompt_key, dhash, size, analysis):
+        """
+        Store (or replace) an entry of the image analysis cache.
+
+        :param key: Cache key (hash of the image bytes and the analysis prompt).
+        :param prompt_key: Hash of the analysis prompt alone.
+        :param dhash: Perceptual hash of the image as 16 hex digits, or None.
+        :param size: (width, height) of the image, or None.
+        :param analysis: Analysis text.
+        """
+        width, height = size or (None, None)
+        await self._execute_write(
+            "INSERT OR REPLACE INTO image_analysis_cache (key, prompt_key, dhash, width, height, analysis, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, prompt_key, dhash, width, height, analysis, int(time.time())),
+        )
+
+    async def prune_image_analysis_cache(self, max_rows):
+        """
+        Delete the least recently used image analyses until at most `max_rows` remain.
+
+        :param max_rows: Maximum number of entries to keep.
+        """
+        await self._execute_write("""
+            DELETE FROM image_analysis_cache WHERE key IN (
+                SELECT key FROM image_analysis_cache
+                ORDER BY used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (max_rows,))
+
+    async def compact(self, pages=1000):
+        """
+        Return up to `pages` free pages to the file system and refresh the
+        query planner statistics.
+
+        :param pages: Maximum number of pages released by incremental vacuum.
         """
         await self._ensure_connection()
-        for _id in ids:
-            await self.db.execute("DELETE FROM history WHERE id = ?", (_id,))
-        await self.db.commit()
+        async with self.pool.write_lock:
+            async with self.db.execute(f"PRAGMA incremental_vacuum({int(pages)})") as cursor:
+                await cursor.fetchall()
+            await self.db.execute("PRAGMA optimize")
+            await self.db.commit()
 
-    async def fetch_user_messages(self, user_id, limit=10):
+    async def get_curation_candidates(self, min_new_rows, limit):
         """
-        Retrieve a limited number of most recent messages from a user.
+        Find users with at least `min_new_rows` history rows that the
+        curation job has not looked at yet.
+
+        :param min_new_rows: Minimum number of un-curated rows.
+        :param limit: Maximum number of users returned.
+        :return: List of user IDs, most un-curated rows first.
+        """
+        rows = await self._fetchall("""
+            SELECT h.user_id, COUNT(*) AS pending
+            FROM history h
+            LEFT JOIN history_curation c ON c.user_id = h.user_id
+            WHERE h.id > COALESCE(c.last_history_id, 0)
+            GROUP BY h.user_id
+            HAVING pending >= ?
+            ORDER BY pending DESC
+            LIMIT ?
+        """, (min_new_rows, limit))
+        return [row[0] for row in rows]
+
+    async def get_uncurated_messages(self, user_id, limit):
+        """
+        Read the oldest history rows of a user that have not been curated yet.
 
         :param user_id: ID of the user.
-        :param limit: Number of messages to retrieve (default: 10).
-        :return: List of message strings.
+        :param limit: Maximum number of rows.
+        :return: List of (id, message) tuples, oldest first.
         """
-        await self._ensure_connection()
-        async with self.db.execute("""
-            SELECT message FROM history
-            WHERE user_id = ?
-            ORDER BY id DESC
+        return await self._fetchall("""
+            SELECT h.id, h.message FROM history h
+            WHERE h.user_id = ? AND h.id > COALESCE(
+                (SELECT last_history_id FROM history_curation WHERE user_id = ?), 0
+            )
+            ORDER BY h.id
             LIMIT ?
-        """, (user_id, limit)) as cursor:
-            rows = await cursor.fetchall()
-            return [row[0] for row in reversed(rows)]
+        """, (user_id, user_id, limit))
 
-    async def set_mode(self, user_id, mode):
+    async def mark_curated(self, user_id, last_id):
         """
-        Set a user-specific interaction mode (e.g., silent, verbose, voice mode).
+        Record that a user's history has been curated up to a given ID.
 
         :param user_id: ID of the user.
-        :param mode: Integer representing the mode.
+        :param last_id: Newest history ID that was curated.
         """
-        await self._ensure_connection()
-        await self.db.execute("""
-            INSERT INTO user_mode (user_id, mode)
-            VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET mode = excluded.mode
-        """, (user_id, mode))
-        await self.db.commit()
+        await self._execute_write("""
+            INSERT INTO history_curation (user_id, last_history_id) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                last_history_id = MAX(last_history_id, excluded.last_history_id)
+        """, (user_id, last_id))
 
-    async def get_mode(self, user_id):
+    async def fetch_user_messages(self, user_id, limit=10):
         """
-        Retrieve the interaction mode set for a specific user.
+        Retrieve a limited number of most recent messages from a user.
 
         :param user_id: ID of the user.
-        :return: Integer representing the mode or None if not set.
+        :param limit: Number of messages to retrieve (default: 10).
+        :return: List of message strings.
         """
-        await self._ensure_connection()
-        async with self.db.execute("SELECT mode FROM user_mode WHERE user_id = ?", (user_id,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else None
+        rows = await self._fetchall("""
+            SELECT message FROM history
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, limit))
+        return [row[0] for row in reversed(rows)]
+
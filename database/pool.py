@@ -0,0 +1,273 @@
+"""
+Process-wide aiosqlite connection pool.
+
+Every DatabaseManager shares one pool per database file instead of opening its
+own connection (and worker thread). A pool holds a single writer connection and
+a configurable number of reader connections.
+
+The database runs in WAL mode so readers never block the writer. Writes go
+through `execute_write`, which either commits immediately or, when group commit
+is enabled, joins a batch that is committed once every `DB_GROUP_COMMIT_MS`.
+`transaction()` groups several writes into one atomic commit.
+"""
+
+import asyncio
+import contextvars
+import os
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+DB_READER_CONNECTIONS = int(os.getenv("DB_READER_CONNECTIONS", "2"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_GROUP_COMMIT_MS = float(os.getenv("DB_GROUP_COMMIT_MS", "0"))
+
+# Set to the pool whose transaction the current task is running inside.
+_current_transaction = contextvars.ContextVar("db_transaction", default=None)
+
+
+class ConnectionPool:
+    """
+    One writer connection plus N reader connections to the same SQLite file.
+
+    Initialisation is guarded by a lock, so concurrent first calls never open
+    duplicate connections.
+    """
+
+    def __init__(
+        self, db_path, readers=DB_READER_CONNECTIONS, group_commit_ms=DB_GROUP_COMMIT_MS
+    ):
+        """
+        :param db_path: Path to the SQLite database file.
+        :param readers: Number of read-only connections to keep open.
+        :param group_commit_ms: Batch window for group commit in milliseconds (0 disables it).
+        """
+        self.db_path = db_path
+        self.readers = max(1, readers)
+        self.group_commit_delay = max(0.0, group_commit_ms) / 1000
+        self.writer = None
+        self.write_lock = asyncio.Lock()
+        self._reader_queue = None
+        self._connections = []
+        self._lock = asyncio.Lock()
+        self._initialized = False
+        self._dirty = False
+        self._commit_waiters = []
+        self._flush_task = None
+
+    @property
+    def is_open(self):
+        """
+        Whether the pool has been opened and not closed since.
+        """
+        return self._initialized
+
+    async def _connect(self):
+        """
+        Open a single connection with the per-connection pragmas applied.
+
+        :return: An open aiosqlite connection.
+        """
+        conn = await aiosqlite.connect(self.db_path)
+        await conn.execute("PRAGMA foreign_keys = ON;")
+        await conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS};")
+        await conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};")
+        self._connections.append(conn)
+        return conn
+
+    async def open(self, setup=None):
+        """
+        Open the writer and reader connections once.
+
+        :param setup: Optional coroutine function called with the writer connection
+                      before the readers are opened (used for schema setup).
+        """
+        if self._initialized:
+            return
+        async with self._lock:
+            if self._initialized:
+                return
+            try:
+                self.writer = await self._connect()
+                await self.writer.execute("PRAGMA journal_mode = WAL;")
+                if setup is not None:
+                    await setup(self.writer)
+                self._reader_queue = asyncio.Queue()
+                for _ in range(self.readers):
+                    self._reader_queue.put_nowait(await self._connect())
+            except Exception:
+                await self._close_connections()
+                raise
+            self._initialized = True
+
+    @asynccontextmanager
+    async def reader(self):
+        """
+        Borrow a reader connection for the duration of the `async with` block.
+
+        :return: An async context manager yielding an aiosqlite connection.
+        """
+        conn = await self._reader_queue.get()
+        try:
+            yield conn
+        finally:
+            self._reader_queue.put_nowait(conn)
+
+    def in_transaction(self):
+        """
+        Whether the current task is running inside this pool's `transaction()`.
+        """
+        return _current_transaction.get() is self
+
+    async def execute_write(self, query, params=(), many=False):
+        """
+        Execute a write statement on the writer connection and make it durable.
+
+        Inside `transaction()` the statement joins the open transaction and is
+        committed when the block exits. Otherwise it is committed right away or,
+        with group commit enabled, together with other writes from the same
+        batch window; in both cases this coroutine returns only once the data
+        is committed.
+
+        :param query: SQL statement.
+        :param params: Statement parameters (a sequence of them when `many` is True).
+        :param many: Use `executemany` instead of `execute`.
+        """
+        run = self.writer.executemany if many else self.writer.execute
+        if self.in_transaction():
+            await run(query, params)
+            return
+
+        if not self.group_commit_delay:
+            async with self.write_lock:
+                await run(query, params)
+                try:
+                    await self.writer.commit()
+                except Exception:
+                    await self.writer.rollback()
+                    raise
+            return
+
+        async with self.write_lock:
+            await run(query, params)
+            self._dirty = True
+            waiter = asyncio.get_running_loop().create_future()
+            self._commit_waiters.append(waiter)
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+        await waiter
+
+    async def _flush_later(self):
+        """
+        Wait for the group-commit window to pass, then commit the whole batch.
+        """
+        await asyncio.sleep(self.group_commit_delay)
+        async with self.write_lock:
+            await self._commit_pending()
+
+    async def _commit_pending(self):
+        """
+        Commit writes queued by group commit and wake up their callers.
+        Must be called with `write_lock` held.
+        """
+        self._flush_task = None
+        if not self._dirty and not self._commit_waiters:
+            return
+        waiters, self._commit_waiters = self._commit_waiters, []
+        self._dirty = False
+        try:
+            await self.writer.commit()
+        except Exception as e:
+            # Drop the failed writes, otherwise they would stay pending and be
+            # committed silently with the next unrelated write.
+            try:
+                await self.writer.rollback()
+            finally:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Run a block of writes as one unit of work with a single commit.
+
+        The writer is held exclusively for the duration of the block and rolled
+        back if the block raises. Nested calls join the outer transaction.
+
+        :return: An async context manager yielding the writer connection.
+        """
+        if self.in_transaction():
+            yield self.writer
+            return
+
+        async with self.write_lock:
+            await self._commit_pending()
+            token = _current_transaction.set(self)
+            try:
+                yield self.writer
+            except BaseException:
+                await self.writer.rollback()
+                raise
+            else:
+                await self.writer.commit()
+            finally:
+                _current_transaction.reset(token)
+
+    async def _close_connections(self):
+        """
+        Close every connection opened by this pool and reset its state.
+        """
+        for conn in self._connections:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+        self._connections = []
+        self.writer = None
+        self._reader_queue = None
+
+    async def close(self):
+        """
+        Close all pooled connections. The pool can be reopened afterwards.
+        """
+        async with self._lock:
+            if self.writer is not None:
+                async with self.write_lock:
+                    await self._commit_pending()
+            await self._close_connections()
+            self._initialized = False
+
+
+_pools = {}
+
+
+def get_pool(db_path="database.db"):
+    """
+    Return the shared pool for a database file, creating it on first use.
+
+    :param db_path: Path to the SQLite database file.
+    :return: The ConnectionPool for `db_path`.
+    """
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = ConnectionPool(db_path)
+    return pool
+
+
+async def close_all_pools():
+    """
+    Close every shared pool. Called once on bot shutdown.
+    """
+    for pool in list(_pools.values()):
+        await pool.close()
@@ -0,0 +1,79 @@
+"""
+History retention.
+
+Keeps the hot `history` table small by moving each user's rows past a row cap
+or older than an age limit into the compressed `history_archive` table, then
+incrementally vacuums and re-analyzes the database.
+"""
+
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+
+from .db import DatabaseManager
+from logger_config import logger
+
+load_dotenv()
+
+
+HISTORY_MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", "2000"))
+HISTORY_MAX_AGE_DAYS = int(os.getenv("HISTORY_MAX_AGE_DAYS", "180"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+VACUUM_PAGES_PER_RUN = int(os.getenv("VACUUM_PAGES_PER_RUN", "2000"))
+
+
+class HistoryRetention:
+    """
+    Periodic job that archives history rows past the per-user caps and
+    compacts the database file.
+    """
+
+    def __init__(
+        self,
+        max_rows=HISTORY_MAX_ROWS,
+        max_age_days=HISTORY_MAX_AGE_DAYS,
+        interval=RETENTION_INTERVAL_SECONDS,
+    ):
+        """
+        :param max_rows: Number of newest rows kept per user (0 disables the cap).
+        :param max_age_days: Maximum age of a hot row in days (0 disables it).
+        :param interval: Seconds between two runs of `run_forever`.
+        """
+        self.db = DatabaseManager()
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.interval = interval
+
+    async def run_once(self) -> int:
+        """
+        Archive every user's excess rows and compact the database once.
+
+        :return: Total number of archived rows.
+        """
+        created_before = (
+            int(time.time()) - self.max_age_days * 86400 if self.max_age_days else None
+        )
+        archived = 0
+        for user_id in await self.db.get_retention_candidates(
+            self.max_rows, created_before
+        ):
+            archived += await self.db.archive_history(
+                user_id, self.max_rows, created_before
+            )
+        await self.db.compact(VACUUM_PAGES_PER_RUN)
+        return archived
+
+    async def run_forever(self) -> None:
+        """
+        Background task that runs `run_once` every `interval` seconds.
+        """
+        while True:
+            try:
+                archived = await self.run_once()
+                if archived:
+                    logger.info(f"🗄️ Archived {archived} history rows.")
+            except Exception as e:
+                logger.error(f"History retention failed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,182 @@
+"""
+Local vector memory for retrieval-augmented prompts.
+
+Each history turn is embedded offline with hashed character n-gram TF
+vectors (no network, no model download) and weighted by IDF at query time.
+Vectors are stored per user in append-only float32 shards that are
+memory-mapped for search, so top-k cosine retrieval over all of a user's
+turns is a couple of vectorised NumPy operations.
+
+Shards only reference history IDs; callers resolve them through
+DatabaseManager, so rows deleted from history simply drop out of results.
+"""
+
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vectors")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "1024"))
+# Cosine similarity below which a turn is not considered related at all.
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.15"))
+
+# Rows scored per matrix product, to bound temporary memory on large shards.
+SEARCH_CHUNK_ROWS = 8192
+
+
+class VectorMemory:
+    """
+    Per-user store of hashed n-gram TF-IDF vectors with cosine top-k search.
+
+    Layout of a user shard inside `directory`:
+        <user_id>.vec  float32 rows of `dim` term frequencies
+        <user_id>.ids  int64 history ID of every row
+        <user_id>.df   float32 document frequency of every hash bucket
+    """
+
+    def __init__(self, directory=VECTOR_STORE_DIR, dim=VECTOR_DIM):
+        """
+        :param directory: Folder holding the user shards.
+        :param dim: Number of hash buckets per vector.
+        """
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+
+    def _path(self, user_id, ext):
+        """
+        :return: Path of one of the shard files of a user.
+        """
+        safe_id = re.sub(r"[^0-9A-Za-z_-]", "_", str(user_id))
+        return os.path.join(self.directory, f"{safe_id}.{ext}")
+
+    def embed(self, text):
+        """
+        Embed text as a sublinear TF vector over hashed word unigrams and
+        character 3-5-grams.
+
+        :param text: Text to embed.
+        :return: float32 array of shape (dim,).
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", (text or "").lower()):
+            features = [f"w:{word}"]
+            padded = f"<{word}>"
+            for n in (3, 4, 5):
+                features.extend(padded[i : i + n] for i in range(len(padded) - n + 1))
+            for feature in features:
+                vector[zlib.crc32(feature.encode("utf-8")) % self.dim] += 1.0
+        np.log1p(vector, out=vector)
+        return vector
+
+    def last_indexed_id(self, user_id):
+        """
+        :param user_id: ID of the user.
+        :return: The newest history ID stored for the user, or 0.
+        """
+        path = self._path(user_id, "ids")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < 8:
+            return 0
+        with open(path, "rb") as f:
+            f.seek(size - size % 8 - 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    def add(self, user_id, rows):
+        """
+        Append turns to a user's shard.
+
+        :param user_id: ID of the user.
+        :param rows: Iterable of (history_id, text) pairs, in increasing ID order.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        matrix = np.stack([self.embed(text) for _, text in rows])
+        ids = np.array([history_id for history_id, _ in rows], dtype=np.int64)
+
+        with self._lock:
+            # Created on the first write so importing the module has no side effects.
+            os.makedirs(self.directory, exist_ok=True)
+            df_path = self._path(user_id, "df")
+            if os.path.exists(df_path):
+                df = np.fromfile(df_path, dtype=np.float32)
+            else:
+                df = np.zeros(self.dim, dtype=np.float32)
+            df += (matrix > 0).sum(axis=0)
+
+            # Write ids last: a crash mid-append leaves extra vectors, which
+            # `search` ignores because it only reads as many rows as ids.
+            with open(self._path(user_id, "vec"), "ab") as f:
+                f.write(matrix.tobytes())
+            df.tofile(df_path)
+            with open(self._path(user_id, "ids"), "ab") as f:
+                f.write(ids.tobytes())
+
+    def search(self, user_id, text, k=5, exclude_ids=(), min_score=VECTOR_MIN_SCORE):
+        """
+        Find the turns most similar to `text`.
+
+        :param user_id: ID of the user.
+        :param text: Query text.
+        :param k: Number of results.
+        :param exclude_ids: History IDs to leave out (e.g. already in the prompt).
+        :param min_score: Minimum cosine similarity of a result.
+        :return: List of (history_id, score) pairs, best first.
+        """
+        ids_path = self._path(user_id, "ids")
+        vec_path = self._path(user_id, "vec")
+        if k <= 0 or not os.path.exists(ids_path) or not os.path.exists(vec_path):
+            return []
+
+        ids = np.fromfile(ids_path, dtype=np.int64)
+        rows = min(len(ids), os.path.getsize(vec_path) // (4 * self.dim))
+        if rows == 0:
+            return []
+        ids = ids[:rows]
+        df = np.fromfile(self._path(user_id, "df"), dtype=np.float32)
+        idf = np.log((1.0 + rows) / (1.0 + df)) + 1.0
+
+        query = self.embed(text) * idf
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        query /= query_norm
+
+        matrix = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, SEARCH_CHUNK_ROWS):
+            weighted = matrix[start : start + SEARCH_CHUNK_ROWS] * idf
+            norms = np.linalg.norm(weighted, axis=1)
+            norms[norms == 0] = 1.0
+            scores[start : start + len(weighted)] = (weighted @ query) / norms
+        del matrix
+
+        if exclude_ids:
+            scores[np.isin(ids, np.fromiter(exclude_ids, dtype=np.int64))] = -1.0
+        top = min(k, rows)
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), float(scores[i])) for i in best if scores[i] >= min_score]
+
+    def drop(self, user_id):
+        """
+        Delete a user's shard (e.g. after the chat history was reset).
+
+        :param user_id: ID of the user.
+        """
+        with self._lock:
+            for ext in ("vec", "ids", "df"):
+                path = self._path(user_id, ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+vector_memory = VectorMemory()
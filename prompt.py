@@ -1,6 +1,218 @@
+import asyncio
+import os
+import string
+
+from dotenv import load_dotenv
+
+from logger_config import logger
+from utils import run_blocking
+
+load_dotenv()
+
+PROMPTS_DIR = "prompts"
+
+# Seconds between two background checks of the prompt files for changes on disk
+# (0 disables them; /reload_prompts still works).
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "10"))
+
+# Placeholders every caller passes to each template. A template that uses a
+# placeholder outside this set would fail on every request, so it is rejected
+# when it is (re)loaded instead.
+PROMPT_FIELDS = {
+    "detect_voice": {"prompt"},
+    "docs_prompt": {"prompt"},
+    "explain_code": {"code"},
+    "get_facts": set(),
+    "image_analyze_prompt": {"BOT_NAME", "content", "prompt", "user_nickname"},
+    "image_failure": {"prompt"},
+    "image_fused_output": {"prompt", "user_nickname"},
+    "image_success": {"prompt"},
+    "memory_prompt": {"nickname", "prompt"},
+    "memory_update": {"nickname", "prompt", "summary"},
+    "optimize_query": {"query"},
+    "photolab": {"prompt"},
+    "quote": set(),
+    "render_image_prompt": {"history_text", "text"},
+    "search_prompt": {"context", "nickname", "query", "results"},
+    "short_response": {"prompt"},
+    "summarize_url_prompt": {"content"},
+    "text_response": {
+        "BOT_NAME",
+        "content",
+        "history_text",
+        "nickname",
+        "recalled_text",
+        "time",
+        "zone",
+    },
+    "useless_message": {"text_user"},
+}
+
+# A line holding only this marker splits a template into a static system part
+# (above) and a per-request part (below). The system part is sent as the
+# model's system instruction, so it may only use placeholders whose value is
+# the same for every request.
+DYNAMIC_MARKER = "<!-- dynamic -->"
+STATIC_FIELDS = {"BOT_NAME"}
+
+
+def _placeholders(text):
+    return {
+        field.split(".")[0].split("[")[0]
+        for _, field, _, _ in string.Formatter().parse(text)
+        if field
+    }
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a prompt section (about 4 characters per token).
+
+    Parameters:
+    - text (str): Prompt text.
+
+    Returns:
+    - int: Estimated number of tokens.
+    """
+    return (len(text) + 3) // 4 if text else 0
+
+
+class PromptRegistry:
+    """
+    Loads every template in the prompts directory once and serves them from
+    memory. Files whose modification time changed are re-read by the `watch`
+    background task, never on the request path.
+    """
+
+    def __init__(self, directory=PROMPTS_DIR, reload_interval=PROMPT_RELOAD_INTERVAL):
+        """
+        Parameters:
+        - directory (str): Folder holding the <name>.txt templates.
+        - reload_interval (float): Seconds between checks for changed files.
+        """
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._templates = {}  # name -> (system, dynamic, placeholders, mtime)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.txt")
+
+    def _load(self, name, mtime):
+        """
+        Reads, splits, parses and validates one template, replacing the cached version.
+
+        Parameters:
+        - name (str): Template name (without .txt).
+        - mtime (float): Modification time of the file.
+
+        Raises:
+        - ValueError: If the template is malformed or uses unknown placeholders.
+        """
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            text = f.read()
+        system, marker, dynamic = text.partition(f"{DYNAMIC_MARKER}\n")
+        if not marker:
+            system, dynamic = "", text
+        system = system.rstrip()
+        fields = _placeholders(system) | _placeholders(dynamic)
+        expected = PROMPT_FIELDS.get(name)
+        if expected is not None and not fields <= expected:
+            raise ValueError(
+                f"Prompt '{name}' uses unknown placeholders: {sorted(fields - expected)}"
+            )
+        if not _placeholders(system) <= STATIC_FIELDS:
+            raise ValueError(
+                f"Prompt '{name}' uses per-request placeholders in its system part: "
+                f"{sorted(_placeholders(system) - STATIC_FIELDS)}"
+            )
+        self._templates[name] = (system, dynamic, fields, mtime)
+
+    def reload(self, force=False):
+        """
+        Loads new templates and re-reads changed ones. A template that fails to
+        load keeps its previous version.
+
+        Parameters:
+        - force (bool): Re-read every file, even if its mtime is unchanged.
+
+        Returns:
+        - list: Names of the templates that were (re)loaded.
+        """
+        loaded = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".txt"):
+                continue
+            name = filename[:-4]
+            mtime = os.path.getmtime(self._path(name))
+            cached = self._templates.get(name)
+            if not force and cached is not None and cached[3] == mtime:
+                continue
+            try:
+                self._load(name, mtime)
+                loaded.append(name)
+            except (OSError, ValueError) as e:
+                if cached is None:
+                    raise
+                logger.error(f"🚨 Keeping previous version of prompt '{name}': {e}")
+        return loaded
+
+    async def watch(self):
+        """
+        Background task that checks the files for changes every
+        `reload_interval` seconds on the "io" executor. Does nothing if the
+        interval is 0 (templates then change only through `reload`).
+        """
+        if self.reload_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                loaded = await run_blocking("io", self.reload)
+                if loaded:
+                    logger.info(f"Reloaded prompt template(s): {', '.join(loaded)}")
+            except Exception as e:
+                logger.error(f"🚨 Error checking prompt templates: {e}")
+
+    def get_parts(self, name):
+        """
+        Returns a cached template split into its system and per-request parts.
+        Only reads memory; the files are read once on first use if `reload`
+        was not called at startup.
+
+        Parameters:
+        - name (str): Template name (without .txt).
+
+        Returns:
+        - tuple: (system text, per-request text, set of placeholder names);
+          the system text is empty for templates without a marker.
+        """
+        if not self._templates:
+            self.reload()
+        if name not in self._templates:
+            raise KeyError(f"Unknown prompt template '{name}'")
+        system, dynamic, fields, _ = self._templates[name]
+        return system, dynamic, fields
+
+    def get(self, name):
+        """
+        Returns a cached template as one text.
+
+        Parameters:
+        - name (str): Template name (without .txt).
+
+        Returns:
+        - tuple: (template text, set of placeholder names)
+        """
+        system, dynamic, fields = self.get_parts(name)
+        return (f"{system}\n\n{dynamic}" if system else dynamic), fields
+
+
+prompt_registry = PromptRegistry()
+
+
 def load_prompt(name):
     """
-    Loads a prompt template from the 'prompts' directory.
+    Returns a prompt template from the 'prompts' directory (cached).
 
     Parameters:
     - name (str): The name of the prompt file (without .txt extension)
@@ -8,14 +220,12 @@ def load_prompt(name):
     Returns:
     - str: The contents of the prompt file as a string.
     """
-    path = f"prompts/{name}.txt"
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    return prompt_registry.get(name)[0]
 
 
 def format_prompt(template_name, **kwargs):
     """
-    Loads a prompt template and formats it using keyword arguments.
+    Formats a cached prompt template using keyword arguments.
 
     Parameters:
     - template_name (str): Name of the template file (without .txt)
@@ -23,6 +233,32 @@ def format_prompt(template_name, **kwargs):
 
     Returns:
     - str: A fully formatted prompt string, ready to be sent to an AI model.
+
+    Raises:
+    - KeyError: If a placeholder of the template is missing from kwargs.
+    """
+    system, content = format_prompt_parts(template_name, **kwargs)
+    return f"{system}\n\n{content}" if system else content
+
+
+def format_prompt_parts(template_name, **kwargs):
+    """
+    Formats a cached prompt template, keeping its static system part apart so
+    it can be sent as a system instruction.
+
+    Parameters:
+    - template_name (str): Name of the template file (without .txt)
+    - **kwargs: Dynamic values to insert into the template
+
+    Returns:
+    - tuple: (system instruction, per-request content); the system instruction
+      is empty for templates without a marker.
+
+    Raises:
+    - KeyError: If a placeholder of the template is missing from kwargs.
     """
-    template = load_prompt(template_name)
-    return template.format(**kwargs)
+    system, dynamic, fields = prompt_registry.get_parts(template_name)
+    missing = fields - kwargs.keys()
+    if missing:
+        raise KeyError(f"Prompt '{template_name}' is missing values for {sorted(missing)}")
+    return system.format(**kwargs), dynamic.format(**kwargs)
@@ -1,9 +1,101 @@
 import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts queued, running and finished jobs."""
+
+    def __init__(self, name, max_workers):
+        """
+        Args:
+            name (str): Executor name, also used as the thread name prefix.
+            max_workers (int): Number of worker threads.
+        """
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self.name = name
+        self.size = max_workers
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self._counter_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._counter_lock:
+            self.queued += 1
+
+        def run():
+            with self._counter_lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._counter_lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        return super().submit(run)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Worker count, queue depth, running and completed jobs.
+        """
+        return {
+            "workers": self.size,
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+        }
+
+
+# Separate pools so that one subsystem can never use up another's threads:
+# "cpu" for parsing, image and vector math, "io" for files and blocking HTTP,
+# "browser" for headless Chrome sessions, which hold a thread for seconds and
+# so also cap how many browsers run at once. Model calls use the SDKs' native
+# async clients instead.
+EXECUTORS = {
+    "cpu": InstrumentedExecutor(
+        "cpu", int(os.getenv("EXECUTOR_CPU_WORKERS", str(os.cpu_count() or 2)))
+    ),
+    "io": InstrumentedExecutor("io", int(os.getenv("EXECUTOR_IO_WORKERS", "8"))),
+    "browser": InstrumentedExecutor(
+        "browser", int(os.getenv("EXECUTOR_BROWSER_WORKERS", "2"))
+    ),
+}
+
+
+async def run_blocking(kind, func, *args, **kwargs):
+    """
+    Run a blocking function on one of the named executors.
+
+    Args:
+        kind (str): Executor name: "cpu", "io" or "browser".
+        func: The blocking function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The result of the blocking function, executed asynchronously.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        EXECUTORS[kind], partial(context.run, func, *args, **kwargs)
+    )
 
 
 async def async_wrap_blocking(func, *args, **kwargs):
     """
-    Safely run blocking functions inside asyncio event loop.
+    Safely run blocking functions inside asyncio event loop (on the "io" executor).
 
     Args:
         func: The blocking function to run.
@@ -13,4 +105,20 @@ async def async_wrap_blocking(func, *args, **kwargs):
     Returns:
         The result of the blocking function, executed asynchronously.
     """
-    return await asyncio.to_thread(func, *args, **kwargs)
\ No newline at end of file
+    return await run_blocking("io", func, *args, **kwargs)
+
+
+def executor_stats():
+    """
+    Returns:
+        dict: `InstrumentedExecutor.stats()` of every named executor.
+    """
+    return {name: executor.stats() for name, executor in EXECUTORS.items()}
+
+
+def shutdown_executors():
+    """
+    Stop the named executors once their running jobs finish. Called on shutdown.
+    """
+    for executor in EXECUTORS.values():
+        executor.shutdown(wait=False, cancel_futures=True)